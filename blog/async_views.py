@@ -0,0 +1,77 @@
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseBadRequest
+
+from . import changelog, views
+from .codec import JsonBytesResponse
+from .pagination import InvalidPage
+
+# Django 3.1 has no async ORM, so these views only stay on the event loop
+# for work that needs no database: the auth check once the user is
+# resolved, and detail GETs answered from the payload cache. Everything
+# else runs the synchronous view on the thread that owns the connection.
+
+
+async def is_authenticated(request):
+    return await sync_to_async(lambda: request.user.is_authenticated, thread_sensitive=True)()
+
+
+async def detail(request, kind, pk, loader):
+    entry = views.cached_entry(kind, pk) or await sync_to_async(loader, thread_sensitive=True)(pk)
+    if entry is None:
+        return HttpResponse(status=404)
+    return views.detail_response(request, *entry)
+
+
+async def article_general(request):
+    if not await is_authenticated(request):
+        return HttpResponse(status=401)
+    return await sync_to_async(views.article_general, thread_sensitive=True)(request)
+
+
+async def article_specified(request, article_id=""):
+    if not await is_authenticated(request):
+        return HttpResponse(status=401)
+    if request.method == 'GET' and not request.GET:
+        return await detail(request, 'article', article_id, views.load_article_entry)
+    return await sync_to_async(views.article_specified, thread_sensitive=True)(request, article_id=article_id)
+
+
+async def comment_article(request, article_id=""):
+    if not await is_authenticated(request):
+        return HttpResponse(status=401)
+    return await sync_to_async(views.comment_article, thread_sensitive=True)(request, article_id=article_id)
+
+
+async def comment_specified(request, comment_id=""):
+    if not await is_authenticated(request):
+        return HttpResponse(status=401)
+    if request.method == 'GET' and not request.GET:
+        return await detail(request, 'comment', comment_id, views.load_comment_entry)
+    return await sync_to_async(views.comment_specified, thread_sensitive=True)(request, comment_id=comment_id)
+
+
+async def change_feed(request):
+    # The long-poll sleeps on the event loop instead of holding a worker
+    # thread; only the reads go through the connection thread.
+    if not await is_authenticated(request):
+        return HttpResponse(status=401)
+    if request.method != 'GET':
+        return await sync_to_async(views.change_feed, thread_sensitive=True)(request)
+    try:
+        since, limit, wait = await sync_to_async(changelog.params, thread_sensitive=True)(request)
+    except InvalidPage:
+        return HttpResponseBadRequest()
+    deadline = time.monotonic() + min(wait, settings.BLOG_CHANGES_MAX_WAIT)
+    read = sync_to_async(changelog.read, thread_sensitive=True)
+    try:
+        body = await read(since, limit)
+        while body is None and time.monotonic() < deadline:
+            await asyncio.sleep(settings.BLOG_CHANGES_POLL_INTERVAL)
+            body = await read(since, limit)
+    except changelog.ChangesGone as e:
+        return JsonBytesResponse({'horizon': e.horizon}, status=410)
+    return JsonBytesResponse(body or changelog.empty(since))
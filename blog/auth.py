@@ -0,0 +1,79 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.db import router, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import cache
+from .models import SigninFailure
+
+
+def user_key(user_id):
+    return 'blog:user:%s' % user_id
+
+
+class CachedModelBackend(ModelBackend):
+    # Resolves request.user from the blog cache so that, together with a
+    # cookie or cached session, authenticated reads need no auth_user query.
+    # Entries are dropped on every save/delete of the user and on logout,
+    # which only reaches other workers through a shared cache
+    # (BLOG_CACHE_SHARED); without one every request reads the user.
+    def get_user(self, user_id):
+        if not settings.BLOG_CACHE_SHARED:
+            return super().get_user(user_id)
+        backend = cache.get_cache()
+        user = backend.get(user_key(user_id))
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                backend.set(user_key(user_id), user, settings.BLOG_USER_CACHE_TIMEOUT)
+        return user
+
+
+def forget_user(user_id):
+    cache.get_cache().delete(user_key(user_id))
+
+
+def username_failure_key(username):
+    return 'blog:signin:user:%s' % username
+
+
+def failure_keys(username, ip):
+    return [username_failure_key(username), 'blog:signin:ip:%s' % ip]
+
+
+def client_ip(request):
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def signin_failures():
+    # Read on the primary: a lagging replica would hand out extra attempts.
+    return SigninFailure.objects.using(router.db_for_write(SigninFailure))
+
+
+def signin_throttled(username, ip):
+    # Checked before authenticate() so a throttled attempt costs no PBKDF2.
+    username_key, ip_key = failure_keys(username, ip)
+    counts = dict(signin_failures().filter(key__in=[username_key, ip_key], window_ends__gt=timezone.now())
+                  .values_list('key', 'count'))
+    return (counts.get(username_key, 0) >= settings.BLOG_SIGNIN_MAX_FAILURES
+            or counts.get(ip_key, 0) >= settings.BLOG_SIGNIN_MAX_IP_FAILURES)
+
+
+def record_signin_failure(username, ip):
+    now = timezone.now()
+    failures = signin_failures()
+    with transaction.atomic(using=failures.db):
+        failures.filter(window_ends__lte=now).delete()
+        for key in failure_keys(username, ip):
+            # The first failure starts the window; later ones increment
+            # inside it.
+            if not failures.filter(key=key).update(count=F('count') + 1):
+                failures.update_or_create(key=key, defaults={
+                    'count': 1, 'window_ends': now + timedelta(seconds=settings.BLOG_SIGNIN_WINDOW)})
+
+
+def clear_signin_failures(username):
+    signin_failures().filter(key=username_failure_key(username)).delete()
@@ -0,0 +1,166 @@
+from collections import Counter
+
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from . import shards
+from .models import Article, Comment, adjust_comment_counts
+from .signals import rows_changed
+
+MAX_BULK_ITEMS = 5000
+BATCH_SIZE = 500
+
+# Required keys (and their types) for every operation, per model.
+OPERATIONS = {
+    Article: {
+        'create': {'title': str, 'content': str},
+        'update': {'id': int, 'title': str, 'content': str},
+        'delete': {'id': int},
+    },
+    Comment: {
+        'create': {'article': int, 'content': str},
+        'update': {'id': int, 'content': str},
+        'delete': {'id': int},
+    },
+}
+
+
+class BulkError(ValueError):
+    def __init__(self, errors):
+        super().__init__('invalid batch')
+        self.errors = errors
+
+
+def validate(model, items):
+    if not isinstance(items, list) or not items:
+        raise BulkError([{'error': 'expected a non-empty list of operations'}])
+    if len(items) > MAX_BULK_ITEMS:
+        raise BulkError([{'error': 'at most %d operations per batch' % MAX_BULK_ITEMS}])
+    errors = []
+    for index, item in enumerate(items):
+        error = validate_item(model, item)
+        if error:
+            errors.append({'index': index, 'error': error})
+    if errors:
+        raise BulkError(errors)
+
+
+def validate_item(model, item):
+    if not isinstance(item, dict):
+        return 'expected an object'
+    fields = OPERATIONS[model].get(item.get('op'))
+    if fields is None:
+        return 'op must be one of %s' % ', '.join(OPERATIONS[model])
+    for name, kind in fields.items():
+        value = item.get(name)
+        if not isinstance(value, kind) or isinstance(value, bool):
+            return '%s must be %s' % (name, 'a string' if kind is str else 'an integer')
+    if model is Article and len(item.get('title', '')) > Article._meta.get_field('title').max_length:
+        return 'title is too long'
+    return None
+
+
+def execute(model, items, user):
+    if not shards.enabled():
+        return execute_on_shard(model, items, user)
+    # One transaction per shard: a batch spanning shards can commit on some
+    # and fail on others. New articles all go to one random shard.
+    results = [None] * len(items)
+    parts = {}
+    new_articles = shards.owner(shards.pick_bucket())
+    for index, item in enumerate(items):
+        if item['op'] != 'create':
+            alias = shards.for_id(item['id'])
+        else:
+            alias = shards.for_id(item['article']) if model is Comment else new_articles
+        parts.setdefault(alias, []).append(index)
+    for alias, indexes in parts.items():
+        with shards.use(alias):
+            for index, result in zip(indexes, execute_on_shard(model, [items[i] for i in indexes], user)):
+                results[index] = result
+    return results
+
+
+def execute_on_shard(model, items, user):
+    results = [None] * len(items)
+    with transaction.atomic(using=router.db_for_write(model)):
+        targets = fetch_targets(model, items)
+        creates, updates, deletes = [], {}, set()
+        for index, item in enumerate(items):
+            op = item['op']
+            if op == 'create':
+                if model is Comment and item['article'] not in targets['articles']:
+                    results[index] = {'status': 404}
+                    continue
+                creates.append((index, new_instance(model, item, user)))
+                continue
+            target = targets['rows'].get(item['id'])
+            if target is None or target.id in deletes:
+                results[index] = {'status': 404, 'id': item['id']}
+            elif target.author_id != user.id:
+                results[index] = {'status': 403, 'id': item['id']}
+            elif op == 'update':
+                apply_update(model, target, item)
+                updates[target.id] = target
+                results[index] = {'status': 200, 'id': target.id}
+            else:
+                deletes.add(target.id)
+                updates.pop(target.id, None)
+                results[index] = {'status': 200, 'id': target.id}
+        create_all(model, [obj for _, obj in creates])
+        for index, obj in creates:
+            results[index] = {'status': 201, 'id': obj.pk}
+        if updates:
+            fields = ['content', 'version', 'updated_at'] + (['title'] if model is Article else [])
+            model.objects.bulk_update(updates.values(), fields, batch_size=BATCH_SIZE)
+            rows_changed.send(sender=model, pks=list(updates), action='update')
+        if deletes and model is Article:
+            Article.objects.filter(id__in=deletes).soft_delete()
+            rows_changed.send(sender=Article, pks=list(deletes), action='delete')
+        elif deletes:
+            model.objects.filter(id__in=deletes).delete()
+    return results
+
+
+def fetch_targets(model, items):
+    ids = {item['id'] for item in items if item['op'] != 'create'}
+    # Locked, in id order, until the batch commits: apply_update() writes
+    # version + 1 from what is read here.
+    rows = model.objects.select_for_update().only('id', 'author_id', 'version').order_by('id').in_bulk(ids) if ids else {}
+    articles = set()
+    if model is Comment:
+        article_ids = {item['article'] for item in items if item['op'] == 'create'}
+        if article_ids:
+            # Locked, as for a single comment, until the new comments are in.
+            articles = set(Article.objects.select_for_update().filter(id__in=article_ids).values_list('id', flat=True))
+    return {'rows': rows, 'articles': articles}
+
+
+def new_instance(model, item, user):
+    if model is Article:
+        return Article(title=item['title'], content=item['content'], author=user, author_username=user.username)
+    return Comment(article_id=item['article'], content=item['content'], author=user)
+
+
+def apply_update(model, target, item):
+    target.content = item['content']
+    if model is Article:
+        target.title = item['title']
+    target.version += 1
+    target.updated_at = timezone.now()
+
+
+def create_all(model, objs):
+    if not objs:
+        return
+    if connections[model.objects.db].features.can_return_rows_from_bulk_insert or shards.enabled():
+        # Sharded ids are allocated up front, so any backend can do this.
+        shards.bulk_create(model, objs, batch_size=BATCH_SIZE)
+        if model is Comment:
+            adjust_comment_counts(Counter(obj.article_id for obj in objs))
+        rows_changed.send(sender=model, pks=[obj.pk for obj in objs], action='create')
+    else:
+        # Backends that cannot report the ids of a multi-row INSERT (SQLite
+        # on Django 3.1) insert row by row, still inside the one transaction.
+        for obj in objs:
+            obj.save(force_insert=True)
@@ -0,0 +1,77 @@
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+
+_stats = {'hits': 0, 'misses': 0, 'sets': 0, 'invalidations': 0, 'evictions': 0}
+_stats_lock = Lock()
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def stats():
+    with _stats_lock:
+        result = dict(_stats)
+    lookups = result['hits'] + result['misses']
+    result['hit_ratio'] = result['hits'] / lookups if lookups else 0.0
+    result['backend'] = type(get_cache()).__name__
+    return result
+
+
+def reset_stats():
+    with _stats_lock:
+        for name in _stats:
+            _stats[name] = 0
+
+
+def get_cache():
+    return caches[settings.BLOG_CACHE_ALIAS]
+
+
+def payload_key(kind, pk):
+    return 'blog:%s:%s' % (kind, pk)
+
+
+def get_payload(kind, pk):
+    payload = get_cache().get(payload_key(kind, pk))
+    _count('misses' if payload is None else 'hits')
+    return payload
+
+
+def set_payload(kind, pk, payload):
+    get_cache().set(payload_key(kind, pk), payload)
+    _count('sets')
+    return payload
+
+
+def invalidate(kind, *pks, using=None):
+    # Dropped now and again once the transaction on ``using`` (the write's
+    # database) commits: a read in between refills the entry from the row
+    # as it was before the write.
+    if pks:
+        keys = [payload_key(kind, pk) for pk in pks]
+        get_cache().delete_many(keys)
+        transaction.on_commit(lambda: get_cache().delete_many(keys), using=using)
+        _count('invalidations', len(pks))
+
+
+class CountingLocMemCache(LocMemCache):
+    # LocMemCache already keeps entries in LRU order; this only records how
+    # many entries it has to drop once MAX_ENTRIES is reached.
+    def _cull(self):
+        before = len(self._cache)
+        super()._cull()
+        _count('evictions', before - len(self._cache))
+
+
+class CountingFileBasedCache(FileBasedCache):
+    def _cull(self):
+        before = len(self._list_cache_files())
+        super()._cull()
+        _count('evictions', max(before - len(self._list_cache_files()), 0))
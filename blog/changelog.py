@@ -0,0 +1,101 @@
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Max
+
+from .models import Article, Change, ChangeHorizon, Comment, PendingChange
+from .pagination import InvalidPage, in_range
+
+KINDS = {Article: 'article', Comment: 'comment'}
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+RELAY_BATCH = 1000
+# pg_advisory_xact_lock key that serializes relays into the log.
+RELAY_LOCK = 0x626c6f67
+
+
+class ChangesGone(Exception):
+    def __init__(self, horizon):
+        super().__init__('changes up to %d were compacted' % horizon)
+        self.horizon = horizon
+
+
+def record(model, pks, action, using=None):
+    # Called from receivers that run inside the writing transaction; the
+    # entry goes to the outbox on the database that transaction is on, so it
+    # commits or rolls back with the data.
+    using = using or router.db_for_write(model)
+    PendingChange.objects.using(using).bulk_create(
+        [PendingChange(kind=KINDS[model], object_id=pk, action=action) for pk in pks])
+
+
+def relay():
+    # Seqs are assigned here, after the write committed and one relay at a
+    # time, so they become visible in seq order: no entry can appear below a
+    # seq a client has already read past.
+    log = router.db_for_write(Change)
+    for using in dict.fromkeys([log, *settings.BLOG_SHARDS]):
+        # A shard transaction still open on this thread has not committed its
+        # entries; on the log's own database they would move in that same
+        # transaction.
+        if using != log and connections[using].in_atomic_block:
+            continue
+        while PendingChange.objects.using(using).exists():
+            with transaction.atomic(using=using):
+                pending = list(PendingChange.objects.using(using).select_for_update(skip_locked=True)
+                               .order_by('id')[:RELAY_BATCH])
+                if not pending:
+                    break
+                with transaction.atomic(using=log):
+                    if connections[log].vendor == 'postgresql':
+                        with connections[log].cursor() as cursor:
+                            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [RELAY_LOCK])
+                    Change.objects.using(log).bulk_create(
+                        [Change(kind=p.kind, object_id=p.object_id, action=p.action, created_at=p.created_at)
+                         for p in pending])
+                # On a shard this commits after the log does, so a failure in
+                # between repeats entries rather than losing them.
+                PendingChange.objects.using(using).filter(id__in=[p.id for p in pending]).delete()
+
+
+def horizon():
+    return ChangeHorizon.objects.values_list('seq', flat=True).first() or 0
+
+
+def latest_seq():
+    relay()
+    return Change.objects.aggregate(seq=Max('seq'))['seq'] or horizon()
+
+
+def params(request):
+    # since=now starts a client at the current end of the log, right after
+    # it has downloaded a full snapshot.
+    try:
+        since = request.GET.get('since', '0')
+        since = latest_seq() if since == 'now' else int(since)
+        limit = int(request.GET.get('limit', DEFAULT_LIMIT))
+        wait = float(request.GET.get('wait', 0))
+    except ValueError:
+        raise InvalidPage('invalid since, limit or wait')
+    if not in_range(since) or limit < 1 or wait < 0:
+        raise InvalidPage('invalid since, limit or wait')
+    return since, min(limit, MAX_LIMIT), wait
+
+
+def read(since, limit):
+    # Returns the response body, or None when there is nothing after since.
+    relay()
+    compacted = horizon()
+    if since < compacted:
+        raise ChangesGone(compacted)
+    rows = list(Change.objects.filter(seq__gt=since).order_by('seq').values('seq', 'kind', 'object_id', 'action')[:limit + 1])
+    if not rows:
+        return None
+    return {
+        'changes': [{'seq': r['seq'], 'kind': r['kind'], 'id': r['object_id'], 'action': r['action']} for r in rows[:limit]],
+        'next': rows[:limit][-1]['seq'],
+        'more': len(rows) > limit,
+    }
+
+
+def empty(since):
+    return {'changes': [], 'next': since, 'more': False}
@@ -0,0 +1,30 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, cls=DjangoJSONEncoder).encode()
+
+
+def loads(data):
+    # Both codecs raise a ValueError subclass on malformed input.
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data.decode() if isinstance(data, bytes) else data)
+
+
+class JsonBytesResponse(HttpResponse):
+    # JsonResponse without the stdlib encoder: bodies go through dumps(),
+    # which uses orjson when it is installed.
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
@@ -0,0 +1,34 @@
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from . import shards
+
+
+def row_etag(kind, pk, *versions):
+    return quote_etag('%s%s.%s' % (kind[0], pk, '.'.join(str(v) for v in versions)))
+
+
+def collection_validators(kind, queryset):
+    # One aggregate over indexed columns stands in for the body: any insert,
+    # delete or update changes either the row count or the newest timestamp.
+    # Unbound sharded reads add the shards' counts and take the newest.
+    summaries = shards.gather(lambda qs: qs.aggregate(count=Count('id'), last=Max('updated_at')), shards.querysets(queryset))
+    last = max((summary['last'] for summary in summaries if summary['last']), default=None)
+    last_modified = last.timestamp() if last else 0
+    etag = quote_etag('%sl.%d.%d' % (kind[0], sum(summary['count'] for summary in summaries), last_modified * 1000000))
+    return etag, int(last_modified)
+
+
+def not_modified(request, etag, last_modified):
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
@@ -0,0 +1,115 @@
+import heapq
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from . import shards
+from .fieldsets import EXCERPT_LENGTH
+from .models import Article, FeedEntry
+from .pagination import InvalidPage, decode_text, encode_cursor, in_range
+
+# The feed is the newest live articles, newest first, at most
+# BLOG_FEED_SIZE of them: new articles go in at the top (pushing the oldest
+# out), deletes take theirs out, and edits and comment counts update the
+# entry in place. It is always an exact prefix of the live articles by
+# created_at, only shorter after deletes until new articles fill it up.
+ORDER = ('-created_at', '-article_id')
+COLUMNS = ('article_id', 'title', 'excerpt', 'author_id', 'author_username', 'comment_count', 'created_at')
+ARTICLE_COLUMNS = ('title', 'content', 'author_id', 'author_username', 'comment_count', 'created_at')
+UPDATED = ('title', 'excerpt', 'author_username', 'comment_count')
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def entry(article):
+    return FeedEntry(article_id=article.pk, created_at=article.created_at, title=article.title,
+                     excerpt=article.content[:EXCERPT_LENGTH], author_id=article.author_id,
+                     author_username=article.author_username, comment_count=article.comment_count)
+
+
+def add(article):
+    FeedEntry.objects.bulk_create([entry(article)], ignore_conflicts=True)
+    trim()
+
+
+def add_ids(ids):
+    # Articles written with bulk_create(), which sends no post_save.
+    FeedEntry.objects.bulk_create([entry(a) for a in shards.fetch(Article.objects.only(*ARTICLE_COLUMNS), ids)],
+                                  ignore_conflicts=True)
+    trim()
+
+
+def update(article):
+    # comment_count is left alone: Article.save() does not write it either.
+    FeedEntry.objects.filter(article_id=article.pk).update(
+        title=article.title, excerpt=article.content[:EXCERPT_LENGTH], author_username=article.author_username)
+
+
+def refresh(ids):
+    # Articles changed through QuerySet.update(); only those in the feed are
+    # read back.
+    present = list(FeedEntry.objects.filter(article_id__in=ids).values_list('article_id', flat=True))
+    if present:
+        articles = shards.fetch(Article.objects.only(*ARTICLE_COLUMNS), present)
+        FeedEntry.objects.bulk_update([entry(a) for a in articles], UPDATED)
+
+
+def remove(ids):
+    FeedEntry.objects.filter(article_id__in=ids).delete()
+
+
+def older_than(created_at, article_id):
+    return Q(created_at__lt=created_at) | Q(created_at=created_at, article_id__lt=article_id)
+
+
+def trim():
+    # Drops whatever is past BLOG_FEED_SIZE; one indexed read when nothing is.
+    cutoff = FeedEntry.objects.order_by(*ORDER).values_list('created_at', 'article_id')[
+        settings.BLOG_FEED_SIZE:settings.BLOG_FEED_SIZE + 1].first()
+    if cutoff is not None:
+        FeedEntry.objects.filter(older_than(*cutoff) | Q(article_id=cutoff[1])).delete()
+
+
+def rebuild():
+    # The newest BLOG_FEED_SIZE live articles of every shard, merged. Sorts
+    # each shard's table by created_at; meant for recovery, not routine use.
+    size = settings.BLOG_FEED_SIZE
+    recent = shards.gather(lambda qs: list(qs.order_by('-created_at', '-id')[:size]),
+                           shards.querysets(Article.objects.only(*ARTICLE_COLUMNS)))
+    articles = list(heapq.merge(*recent, key=lambda a: (a.created_at, a.id), reverse=True))[:size]
+    with transaction.atomic():
+        FeedEntry.objects.all().delete()
+        FeedEntry.objects.bulk_create([entry(a) for a in articles])
+    return len(articles)
+
+
+def encode_position(created_at, article_id):
+    return encode_cursor('%d.%d' % ((created_at - EPOCH) // MICROSECOND, article_id))
+
+
+def decode_position(cursor):
+    try:
+        micros, article_id = decode_text(cursor).split('.')
+        created_at, article_id = EPOCH + int(micros) * MICROSECOND, int(article_id)
+    except (ValueError, OverflowError):
+        raise InvalidPage('invalid cursor')
+    if not in_range(article_id):
+        raise InvalidPage('invalid cursor')
+    return created_at, article_id
+
+
+def page(limit, after=None):
+    # One range read on blog_feed_recent_idx. Returns (items, next cursor).
+    entries = FeedEntry.objects.order_by(*ORDER)
+    if after is not None:
+        entries = entries.filter(older_than(*after))
+    rows = list(entries.values_list(*COLUMNS)[:limit + 1])
+    next_cursor = encode_position(rows[limit - 1][-1], rows[limit - 1][0]) if len(rows) > limit else None
+    return [item(row) for row in rows[:limit]], next_cursor
+
+
+def item(row):
+    return {'id': row[0], 'title': row[1], 'excerpt': row[2], 'author': row[3],
+            'author_username': row[4], 'comment_count': row[5], 'created_at': row[6]}
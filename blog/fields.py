@@ -0,0 +1,87 @@
+import gzip
+import zlib
+
+from django.conf import settings
+from django.db import models
+from django.db.models import ExpressionWrapper, F
+
+# Stored values start with a format byte: RAW is the UTF-8 text as is, GZIP
+# a gzip member of it (mtime 0), which can go to an HTTP client with
+# Content-Encoding: gzip without being inflated first.
+RAW = b'\x00'
+GZIP = b'\x01'
+GZIP_LEVEL = 6
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+# A character is at most this many bytes of UTF-8.
+MAX_CHAR_BYTES = 4
+
+
+def pack(text, min_bytes=None):
+    # Compressed from min_bytes (BLOG_CONTENT_COMPRESS_MIN_BYTES) of UTF-8
+    # up, unless that does not make it smaller.
+    data = text.encode()
+    if min_bytes is None:
+        min_bytes = settings.BLOG_CONTENT_COMPRESS_MIN_BYTES
+    if len(data) >= min_bytes:
+        compressed = gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+        if len(compressed) < len(data):
+            return GZIP + compressed
+    return RAW + data
+
+
+def unpack(value, max_chars=None):
+    # With max_chars, only as much as that many characters can take is
+    # decoded (or inflated).
+    if value is None or isinstance(value, str):
+        # str: a row written before the column was converted.
+        return value if value is None or max_chars is None else value[:max_chars]
+    value = bytes(value)
+    header, body = value[:1], value[1:]
+    if header == GZIP:
+        if max_chars is None:
+            body = zlib.decompress(body, GZIP_WBITS)
+        else:
+            body = zlib.decompressobj(GZIP_WBITS).decompress(body, max_chars * MAX_CHAR_BYTES)
+    elif header != RAW:
+        raise ValueError('unknown stored text format %r' % header)
+    if max_chars is None:
+        return body.decode()
+    # A cut can split the last character; drop what is left of it.
+    return body[:max_chars * MAX_CHAR_BYTES].decode(errors='ignore')[:max_chars]
+
+
+def is_gzip(stored):
+    return stored is not None and not isinstance(stored, str) and bytes(stored[:1]) == GZIP
+
+
+class CompressedTextField(models.TextField):
+    # A TextField kept in a BLOB (bytea) column through pack() and unpack().
+    # SQL only sees bytes: no LIKE or Substr on it (see Prefix), and
+    # exact lookups only match values packed with the same threshold.
+    def get_internal_type(self):
+        return 'BinaryField'
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        value = super().get_db_prep_value(value, connection, prepared)
+        if value is None:
+            return None
+        return connection.Database.Binary(pack(value))
+
+    def from_db_value(self, value, expression, connection):
+        return unpack(value)
+
+
+class Prefix(ExpressionWrapper):
+    # The first ``length`` characters of a CompressedTextField, for excerpts;
+    # cut here rather than in SQL, inflating only the start of the value.
+    def __init__(self, name, length):
+        super().__init__(F(name), output_field=models.TextField())
+        self.length = length
+
+    def convert_value(self, value, expression, connection):
+        return unpack(value, self.length)
+
+
+def stored(name):
+    # The column's bytes as stored (str for unconverted rows).
+    return ExpressionWrapper(F(name), output_field=models.BinaryField())
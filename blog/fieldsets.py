@@ -0,0 +1,78 @@
+from .fields import Prefix
+
+EXCERPT = object()
+EXCERPT_LENGTH = 200
+MAX_EXCERPT_LENGTH = 2000
+
+# Output name -> model column for every endpoint that accepts ?fields=.
+# EXCERPT is the first ?excerpt_length= characters of content (see Prefix).
+ARTICLE_LIST = {'title': 'title', 'content': 'content', 'author': 'author_id',
+                'author_username': 'author_username', 'comment_count': 'comment_count', 'excerpt': EXCERPT}
+ARTICLE_LIST_DEFAULT = ('title', 'content', 'author', 'author_username', 'comment_count')
+ARTICLE_DETAIL = {'title': 'title', 'content': 'content', 'author': 'author_username',
+                  'comment_count': 'comment_count', 'excerpt': EXCERPT}
+ARTICLE_DETAIL_DEFAULT = ('title', 'content', 'author', 'comment_count')
+COMMENT = {'article': 'article_id', 'author': 'author_id', 'content': 'content'}
+COMMENT_DEFAULT = ('article', 'author', 'content')
+
+
+class InvalidFields(ValueError):
+    pass
+
+
+def requested(request, columns, default):
+    raw = request.GET.get('fields')
+    if raw is None:
+        return default
+    names = tuple(dict.fromkeys(name.strip() for name in raw.split(',') if name.strip()))
+    unknown = [name for name in names if name not in columns]
+    if unknown or not names:
+        raise InvalidFields('unknown fields: %s' % ', '.join(unknown))
+    if 'excerpt' in names:
+        excerpt_length(request)
+    return names
+
+
+def excerpt_length(request):
+    try:
+        length = int(request.GET.get('excerpt_length', EXCERPT_LENGTH))
+    except ValueError:
+        raise InvalidFields('invalid excerpt_length')
+    if length < 1:
+        raise InvalidFields('invalid excerpt_length')
+    return min(length, MAX_EXCERPT_LENGTH)
+
+
+def values(queryset, request, columns, names, extra=('id',)):
+    # Reads only the columns behind ``names`` (plus ``extra``).
+    selected = list(extra)
+    annotations = {}
+    for name in names:
+        if columns[name] is EXCERPT:
+            annotations['excerpt'] = Prefix('content', excerpt_length(request))
+        elif columns[name] not in selected:
+            selected.append(columns[name])
+    return queryset.values(*selected, **annotations)
+
+
+def item(row, columns, names):
+    return {name: row['excerpt' if columns[name] is EXCERPT else columns[name]] for name in names}
+
+
+def select(data, request, names):
+    # Same projection over an already serialized detail payload.
+    result = {}
+    for name in names:
+        result[name] = data['content'][:excerpt_length(request)] if name == 'excerpt' else data[name]
+    return result
+
+
+def etag_variant(etag, names, default, request):
+    # Each projection is its own representation and needs its own ETag; so
+    # is each excerpt length.
+    if names == default:
+        return etag
+    suffix = ','.join(names)
+    if 'excerpt' in names:
+        suffix += ';%d' % excerpt_length(request)
+    return etag[:-1] + ';' + suffix + '"'
@@ -0,0 +1,10 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class ConfigurablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    # Same 'pbkdf2_sha256' format as Django's hasher, so existing hashes keep
+    # verifying; users are rehashed at the new cost on their next signin.
+    @property
+    def iterations(self):
+        return settings.BLOG_PASSWORD_ITERATIONS
@@ -0,0 +1,239 @@
+import http.cookiejar
+import json
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ApiSession:
+    # One cookie jar per simulated client, driving the same token/signin
+    # handshake a browser would.
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies))
+        self.own_articles = []
+
+    def csrftoken(self):
+        for cookie in self.cookies:
+            if cookie.name == 'csrftoken':
+                return cookie.value
+        return ''
+
+    def request(self, method, path, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, method=method)
+        request.add_header('Content-Type', 'application/json')
+        request.add_header('X-CSRFToken', self.csrftoken())
+        try:
+            with self.opener.open(request) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def signin(self, username, password):
+        self.request('GET', '/api/token/')
+        credentials = {'username': username, 'password': password}
+        self.request('POST', '/api/signup/', credentials)
+        status, _ = self.request('POST', '/api/signin/', credentials)
+        if status != 204:
+            raise RuntimeError('signin as %s failed with %d' % (username, status))
+
+
+class FixedScenario:
+    def __init__(self, method, path, body=None, label='request'):
+        self.request = (label, method, path, body)
+
+    def next_request(self, session, rng):
+        return self.request
+
+    def record(self, session, label, status, body):
+        pass
+
+
+class ReplayScenario:
+    # Replays recorded requests, one JSON object per line with method, path
+    # and optional body, in order and wrapping around.
+    def __init__(self, lines):
+        self.requests = []
+        for line in lines:
+            if line.strip():
+                item = json.loads(line)
+                self.requests.append((item.get('label') or item['method'].upper() + ' ' + item['path'],
+                                      item['method'].upper(), item['path'], item.get('body')))
+        self.position = 0
+        self.lock = threading.Lock()
+
+    def next_request(self, session, rng):
+        with self.lock:
+            request = self.requests[self.position % len(self.requests)]
+            self.position += 1
+        return request
+
+    def record(self, session, label, status, body):
+        pass
+
+
+class MixScenario:
+    # Weighted synthetic traffic. Reads pick random ids in 1..article_count
+    # (what blog_seed creates); writes only touch articles the simulated
+    # client created itself so PUT/DELETE never hit someone else's row.
+    def __init__(self, weights, article_count):
+        self.labels = list(weights)
+        self.weights = [weights[label] for label in self.labels]
+        self.article_count = max(article_count, 1)
+
+    def next_request(self, session, rng):
+        label = rng.choices(self.labels, self.weights)[0]
+        if label in ('update', 'delete') and not session.own_articles:
+            label = 'create'
+        article_id = rng.randint(1, self.article_count)
+        if label == 'list':
+            return label, 'GET', '/api/article/?limit=20', None
+        if label == 'detail':
+            return label, 'GET', '/api/article/%d/' % article_id, None
+        if label == 'comments':
+            return label, 'GET', '/api/article/%d/comment/?limit=20' % article_id, None
+        if label == 'comment':
+            return label, 'POST', '/api/article/%d/comment/' % article_id, {'content': 'load test comment'}
+        if label == 'signin':
+            return label, 'POST', '/api/signin/', session.credentials
+        if label == 'create':
+            return label, 'POST', '/api/article/', {'title': 'load test', 'content': 'load test article ' * 20}
+        if label == 'update':
+            return label, 'PUT', '/api/article/%d/' % session.own_articles[-1], {'title': 'edited', 'content': 'edited'}
+        return label, 'DELETE', '/api/article/%d/' % session.own_articles.pop(), None
+
+    def record(self, session, label, status, body):
+        if label == 'create' and status == 201:
+            session.own_articles.append(json.loads(body)['id'])
+
+
+MIXES = {
+    'read': {'list': 20, 'detail': 60, 'comments': 20},
+    'default': {'list': 15, 'detail': 45, 'comments': 15, 'comment': 8, 'create': 5, 'update': 5, 'delete': 3, 'signin': 4},
+    'write': {'create': 100},
+}
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def is_error(status):
+    # A 429 measured the rate limiter, not the endpoint: run the server with
+    # BLOG_RATE_LIMITING=0 to load it.
+    return status >= 500 or status == 429
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'elapsed_s': round(elapsed, 3),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+_metric_line = re.compile(r'^blog_db_queries_(sum|count)\{route="([^"]+)"\} (\S+)$', re.M)
+
+
+def scrape_queries(session):
+    status, body = session.request('GET', '/api/metrics/')
+    totals = defaultdict(lambda: [0.0, 0.0])
+    if status == 200:
+        for kind, route, value in _metric_line.findall(body.decode()):
+            totals[route][0 if kind == 'sum' else 1] = float(value)
+    return totals
+
+
+def queries_per_request(before, after):
+    result = {}
+    for route, (total, count) in after.items():
+        total -= before.get(route, (0.0, 0.0))[0]
+        count -= before.get(route, (0.0, 0.0))[1]
+        if count > 0 and route != 'metrics':
+            result[route] = round(total / count, 2)
+    return result
+
+
+def run(base_url, scenario, concurrency, total, username, password, seed=0):
+    sessions = [ApiSession(base_url) for _ in range(concurrency)]
+    for session in sessions:
+        session.credentials = {'username': username, 'password': password}
+        session.signin(username, password)
+    before = scrape_queries(sessions[0])
+    counter = iter(range(total))
+    lock = threading.Lock()
+    latencies = defaultdict(list)
+    statuses = defaultdict(lambda: defaultdict(int))
+
+    def worker(args):
+        index, session = args
+        rng = random.Random(seed * 1000003 + index)
+        while True:
+            with lock:
+                n = next(counter, None)
+            if n is None:
+                return
+            label, method, path, body = scenario.next_request(session, rng)
+            started = time.perf_counter()
+            status, content = session.request(method, path, body)
+            elapsed = time.perf_counter() - started
+            scenario.record(session, label, status, content)
+            with lock:
+                latencies[label].append(elapsed)
+                statuses[label][status] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, enumerate(sessions)))
+    elapsed = time.perf_counter() - started
+    after = scrape_queries(sessions[0])
+
+    def errors(label):
+        return sum(count for status, count in statuses[label].items() if is_error(status))
+
+    endpoints = {}
+    for label in sorted(latencies):
+        endpoints[label] = summarize(latencies[label], errors(label), elapsed)
+        endpoints[label]['statuses'] = {str(k): v for k, v in sorted(statuses[label].items())}
+    report = summarize([x for values in latencies.values() for x in values], sum(errors(label) for label in latencies), elapsed)
+    report['endpoints'] = endpoints
+    report['queries_per_request'] = queries_per_request(before, after)
+    return report
+
+
+def compare(report, baseline, tolerance):
+    # Flags endpoints that got slower or lower-throughput by more than
+    # ``tolerance`` (a fraction), and any route issuing more queries.
+    regressions = []
+    for target, result in report.items():
+        base = baseline.get(target)
+        if base is None:
+            continue
+        for label, current in result['endpoints'].items():
+            previous = base.get('endpoints', {}).get(label)
+            if previous is None:
+                continue
+            if previous['p95_ms'] and current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+                regressions.append('%s %s: p95 %.2fms > baseline %.2fms' % (target, label, current['p95_ms'], previous['p95_ms']))
+            if current['rps'] < previous['rps'] * (1 - tolerance):
+                regressions.append('%s %s: %.1f req/s < baseline %.1f req/s' % (target, label, current['rps'], previous['rps']))
+        for route, queries in result['queries_per_request'].items():
+            previous = base.get('queries_per_request', {}).get(route)
+            if previous is not None and queries > previous + 0.01:
+                regressions.append('%s %s: %.2f queries/request > baseline %.2f' % (target, route, queries, previous))
+    return regressions
@@ -0,0 +1,58 @@
+import itertools
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from blog import shards
+from blog.fieldsets import EXCERPT_LENGTH
+from blog.fields import is_gzip, pack, unpack
+from blog.models import Article, Comment
+
+
+class Command(BaseCommand):
+    help = ('Compare stored size and per-row CPU of article and comment content as plain text '
+            '(a TextField) and as CompressedTextField values, on a sample of existing rows. '
+            'Read-only; nothing is rewritten.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sample', type=int, default=1000, help='Rows per model')
+        parser.add_argument('--min-bytes', type=int, default=None,
+                            help='Compression threshold (default BLOG_CONTENT_COMPRESS_MIN_BYTES)')
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        min_bytes = options['min_bytes']
+        if min_bytes is None:
+            min_bytes = settings.BLOG_CONTENT_COMPRESS_MIN_BYTES
+        self.stdout.write('threshold %d bytes' % min_bytes)
+        for name, model in (('article', Article), ('comment', Comment)):
+            rows = shards.iterator(model.all_objects.values_list('id', 'content'), 2000)
+            texts = [content for _, content in itertools.islice(rows, options['sample'])]
+            if not texts:
+                self.stdout.write('%-8s no rows' % name)
+                continue
+            encoded = [text.encode() for text in texts]
+            packed = [pack(text, min_bytes) for text in texts]
+            plain_bytes, packed_bytes = sum(map(len, encoded)), sum(map(len, packed))
+            self.stdout.write('%-8s %d rows, %d compressed; %d -> %d bytes (%.1f%%)' % (
+                name, len(texts), sum(1 for value in packed if is_gzip(value)),
+                plain_bytes, packed_bytes, 100.0 * packed_bytes / plain_bytes if plain_bytes else 100.0))
+            for label, plain, compressed in (
+                    ('write', lambda: [text.encode() for text in texts], lambda: [pack(text, min_bytes) for text in texts]),
+                    ('read', lambda: [data.decode() for data in encoded], lambda: [unpack(value) for value in packed]),
+                    ('excerpt', lambda: [data.decode()[:EXCERPT_LENGTH] for data in encoded],
+                     lambda: [unpack(value, EXCERPT_LENGTH) for value in packed])):
+                self.stdout.write('%-8s %-7s %8.2f us/row as text, %8.2f us/row compressed' % (
+                    name, label, self.time(plain, options['repeat'], len(texts)),
+                    self.time(compressed, options['repeat'], len(texts))))
+
+    def time(self, func, repeat, rows):
+        # Best of ``repeat`` runs, in microseconds per row.
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best * 1000000 / rows
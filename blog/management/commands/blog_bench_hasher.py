@@ -0,0 +1,35 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = ('Time PBKDF2 password hashing at several iteration counts and suggest the highest '
+            'count that stays within a per-signin CPU budget (BLOG_PASSWORD_ITERATIONS).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('iterations', nargs='*', type=int,
+                            default=[10000, 50000, 100000, 216000, 320000])
+        parser.add_argument('--budget-ms', type=float, default=50.0)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        hasher = PBKDF2PasswordHasher()
+        salt = hasher.salt()
+        suggestion = None
+        self.stdout.write('current BLOG_PASSWORD_ITERATIONS=%d' % settings.BLOG_PASSWORD_ITERATIONS)
+        for iterations in sorted(options['iterations']):
+            started = time.perf_counter()
+            for _ in range(options['repeat']):
+                hasher.encode('benchmark-password', salt, iterations)
+            elapsed_ms = (time.perf_counter() - started) * 1000 / options['repeat']
+            self.stdout.write('%8d iterations: %7.2f ms/hash, %6.1f signins/s per core' % (
+                iterations, elapsed_ms, 1000 / elapsed_ms if elapsed_ms else 0))
+            if elapsed_ms <= options['budget_ms']:
+                suggestion = iterations
+        if suggestion:
+            self.stdout.write('highest count within %.0f ms: %d' % (options['budget_ms'], suggestion))
+        else:
+            self.stdout.write('no tested count fits within %.0f ms' % options['budget_ms'])
@@ -0,0 +1,105 @@
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# full and lean differ only in the settings profile; lean-stdlib is lean as
+# it should be deployed, with SETUPTOOLS_USE_DISTUTILS=stdlib (it has to be
+# set before the interpreter starts, see myblog/settings.py), so that row
+# shows the flag's own effect. 'local' is setuptools' default.
+PROFILES = {
+    'full': {'BLOG_API_ONLY': '0', 'SETUPTOOLS_USE_DISTUTILS': 'local'},
+    'lean': {'BLOG_API_ONLY': '1', 'SETUPTOOLS_USE_DISTUTILS': 'local'},
+    'lean-stdlib': {'BLOG_API_ONLY': '1', 'SETUPTOOLS_USE_DISTUTILS': 'stdlib'},
+}
+
+# Run in a fresh interpreter per profile. Prints a line as soon as the first
+# response is complete, then times --requests anonymous GETs through the
+# whole WSGI handler and straight into the view; the difference is the
+# middleware and URL resolution cost.
+CHILD = '''
+import io, json, sys, time
+import myblog.wsgi
+environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/api/cache/', 'SERVER_NAME': 'localhost',
+           'SERVER_PORT': '80', 'HTTP_HOST': 'localhost', 'wsgi.url_scheme': 'http'}
+def request(n):
+    return dict(environ, REMOTE_ADDR='10.0.%d.%d' % (n // 256 % 256, n % 256), **{'wsgi.input': io.BytesIO()})
+b''.join(myblog.wsgi.application(request(0), lambda status, headers: None))
+print('ready', flush=True)
+import logging
+logging.disable(logging.WARNING)  # every 401 would be logged to django.request
+from django.contrib.auth.models import AnonymousUser
+from django.core.handlers.wsgi import WSGIRequest
+from blog.views import cache_stats
+count = int(sys.argv[1])
+started = time.perf_counter()
+for n in range(count):
+    b''.join(myblog.wsgi.application(request(n + 1), lambda status, headers: None))
+handler = (time.perf_counter() - started) / count
+requests = [WSGIRequest(request(n)) for n in range(count)]
+started = time.perf_counter()
+for r in requests:
+    r.user = AnonymousUser()
+    cache_stats(r)
+view = (time.perf_counter() - started) / count
+print(json.dumps({'handler_us': handler * 1e6, 'view_us': view * 1e6}))
+'''
+
+_importtime_line = re.compile(r'^import time:\s+(\d+) \|\s+\d+ \| *(\S+)', re.M)
+
+
+class Command(BaseCommand):
+    help = ('Compare the full and API-only (BLOG_API_ONLY) settings profiles, and the latter with '
+            'SETUPTOOLS_USE_DISTUTILS=stdlib: import time '
+            '(python -X importtime), time from process start to the first response, and '
+            'per-request middleware overhead. Each measurement runs in a fresh interpreter.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=3, help='Cold starts per profile; the best is reported')
+        parser.add_argument('--top', type=int, default=5, help='Slowest top-level imports to list')
+
+    def handle(self, *args, **options):
+        for name, profile in PROFILES.items():
+            env = dict(os.environ, DJANGO_SETTINGS_MODULE='myblog.settings', **profile)
+            env['PYTHONPATH'] = os.pathsep.join(filter(None, [str(settings.BASE_DIR), env.get('PYTHONPATH')]))
+            report = self.import_times(env, options['top'])
+            runs = [self.serve(env, options['requests']) for _ in range(options['repeat'])]
+            best = min(runs, key=lambda run: run['first_response_ms'])
+            report.update(best, middleware_us=best['handler_us'] - best['view_us'])
+            self.stdout.write('%-11s %s' % (name, json.dumps({k: round(v, 1) if isinstance(v, float) else v
+                                                              for k, v in report.items()}, sort_keys=True)))
+
+    def import_times(self, env, top):
+        script = 'import myblog.wsgi; from django.urls import resolve; resolve("/api/article/")'
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', script], env=env,
+                                stderr=subprocess.PIPE, stdout=subprocess.DEVNULL, check=True, text=True)
+        # Own import time summed per top-level package.
+        packages = {}
+        for line in result.stderr.splitlines():
+            match = _importtime_line.match(line)
+            if match:
+                package = match.group(2).split('.')[0]
+                packages[package] = packages.get(package, 0) + int(match.group(1))
+        slowest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+        return {'import_ms': sum(packages.values()) / 1000, 'modules': len(_importtime_line.findall(result.stderr)),
+                'slowest_packages': ['%s %.1fms' % (package, us / 1000) for package, us in slowest]}
+
+    def serve(self, env, count):
+        started = time.perf_counter()
+        child = subprocess.Popen([sys.executable, '-c', CHILD, str(count)], env=env,
+                                 stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        try:
+            assert child.stdout.readline().strip() == 'ready'
+            first_response = time.perf_counter() - started
+            result = json.loads(child.stdout.readline())
+        finally:
+            child.stdout.close()
+            child.wait()
+        result['first_response_ms'] = first_response * 1000
+        return result
@@ -0,0 +1,74 @@
+import json
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+
+from blog.loadtest import is_error, summarize
+
+
+class Command(BaseCommand):
+    help = ('Run parallel POST /api/article/ clients in-process against the configured database and '
+            'report throughput, latency and failures, with SQLite tuning (BLOG_SQLITE_TUNING) off '
+            'and on. Writes real rows; point DATABASE_URL at a scratch database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--writes', type=int, default=50, help='Articles created per thread')
+        parser.add_argument('--username', default='bench_writer')
+        parser.add_argument('--password', default='bench-writer-password')
+        parser.add_argument('--only', choices=['tuned', 'untuned'])
+
+    def handle(self, *args, **options):
+        if not User.objects.filter(username=options['username']).exists():
+            User.objects.create_user(options['username'], None, options['password'])
+        for name in [options['only']] if options['only'] else ['untuned', 'tuned']:
+            # Rate limits off: the limiter would answer most writes itself.
+            with override_settings(BLOG_SQLITE_TUNING=name == 'tuned', BLOG_RATE_LIMITS={}):
+                # Reconnect so the journal mode is switched once, here, rather
+                # than by every writer thread at the same time.
+                connection.close()
+                if connection.vendor == 'sqlite' and name == 'untuned':
+                    with connection.cursor() as cursor:
+                        cursor.execute('PRAGMA journal_mode = DELETE')
+                connection.ensure_connection()
+                report = self.run(options)
+            self.stdout.write('%-8s %s' % (name, json.dumps(report, sort_keys=True)))
+        connection.close()
+
+    def run(self, options):
+        latencies, statuses = [], {}
+        lock = threading.Lock()
+        body = json.dumps({'title': 'bench', 'content': 'concurrent writer benchmark ' * 20})
+        ready = threading.Barrier(options['threads'])
+
+        def writer():
+            client = Client(HTTP_HOST='localhost')
+            client.login(username=options['username'], password=options['password'])
+            ready.wait()
+            for _ in range(options['writes']):
+                started = time.perf_counter()
+                try:
+                    status = client.post('/api/article/', body, content_type='application/json').status_code
+                except Exception:
+                    # "database is locked" reaches the test client as an exception.
+                    status = 500
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+                    statuses[status] = statuses.get(status, 0) + 1
+            connection.close()
+
+        threads = [threading.Thread(target=writer) for _ in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        report = summarize(latencies, sum(n for status, n in statuses.items() if is_error(status)), elapsed)
+        report['statuses'] = {str(k): v for k, v in sorted(statuses.items())}
+        return report
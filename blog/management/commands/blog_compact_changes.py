@@ -0,0 +1,35 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from blog import changelog
+from blog.models import Change, ChangeHorizon
+
+
+class Command(BaseCommand):
+    help = ('Delete /api/changes/ log entries older than the retention window, in batches. '
+            'Clients behind the new horizon get 410 and must resync.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=float, default=settings.BLOG_CHANGES_RETENTION_DAYS)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['retention_days'])
+        through = Change.objects.filter(created_at__lt=cutoff).aggregate(seq=Max('seq'))['seq']
+        removed = 0
+        if through is not None and through > changelog.horizon():
+            # Record the horizon first so no client is served a log with a
+            # silent gap while the batches run.
+            ChangeHorizon.objects.update_or_create(id=1, defaults={'seq': through})
+            while True:
+                with transaction.atomic():
+                    batch = list(Change.objects.filter(seq__lte=through).order_by('seq').values_list('seq', flat=True)[:options['batch_size']])
+                    if not batch:
+                        break
+                    removed += Change.objects.filter(seq__gte=batch[0], seq__lte=batch[-1]).delete()[0]
+        self.stdout.write('Removed %d change log entries; horizon is seq %d' % (removed, changelog.horizon()))
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog import transfer
+
+
+class Command(BaseCommand):
+    help = ('Stream users, articles and comments to an NDJSON file (gzip-compressed when the '
+            'name ends in .gz) for blog_import. Soft-deleted articles are left out.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched per database round trip')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        def progress(kind, count):
+            self.stderr.write('%s: %d rows, %.0f rows/s' % (kind, count, count / (time.perf_counter() - started)))
+
+        with transfer.open_stream(options['path'], 'wb') as out:
+            counts = transfer.export(out, options['chunk_size'], progress if options['verbosity'] > 1 else None)
+        elapsed = time.perf_counter() - started
+        self.stdout.write('Exported %d users, %d articles, %d comments in %.1fs (%.0f rows/s)' % (
+            counts['user'], counts['article'], counts['comment'], elapsed, sum(counts.values()) / max(elapsed, 1e-9)))
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blog import transfer
+
+
+class Command(BaseCommand):
+    help = ('Load a blog_export file in batches. Users are matched by username; articles and '
+            'comments get new ids. Rows bypass signals, so run blog_rebuild_search and '
+            'blog_rebuild_feed afterwards. With --checkpoint NAME, each batch is recorded in the '
+            'database as it commits, and a rerun with the same name resumes after the last one.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per transaction')
+        parser.add_argument('--checkpoint', metavar='NAME', help='Name to record progress under and resume from')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        reported = [started]
+
+        def progress(kind, count):
+            now = time.perf_counter()
+            if options['verbosity'] > 1 or now - reported[0] >= 5:
+                reported[0] = now
+                self.stderr.write('%s: %d rows, %.0f rows/s' % (kind, count, count / (now - started)))
+
+        importer = transfer.Importer(options['batch_size'], options['checkpoint'], progress)
+        if importer.position:
+            self.stdout.write('Resuming after record %d' % importer.position)
+        try:
+            with transfer.open_stream(options['path'], 'rb') as stream:
+                counts = importer.run(stream)
+        except transfer.InvalidExport as e:
+            raise CommandError(e)
+        elapsed = time.perf_counter() - started
+        self.stdout.write('Imported %d users, %d articles, %d comments in %.1fs (%.0f rows/s)' % (
+            counts['user'], counts['article'], counts['comment'], elapsed, sum(counts.values()) / max(elapsed, 1e-9)))
@@ -0,0 +1,63 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blog import loadtest
+
+
+class Command(BaseCommand):
+    help = ('Drive a running blog server at fixed concurrency and report throughput, latency '
+            'percentiles and queries per request (scraped from /api/metrics/) as JSON. Pass '
+            'several --target options to compare deployments, e.g. runserver (WSGI) against '
+            'uvicorn myblog.asgi:application, and --baseline to fail on regressions. 429s count as '
+            'errors: start the servers with BLOG_RATE_LIMITING=0.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', required=True, metavar='NAME=URL',
+                            help='Deployment to measure, e.g. wsgi=http://127.0.0.1:8000')
+        parser.add_argument('--mix', choices=sorted(loadtest.MIXES),
+                            help='Synthetic request mix to replay instead of a single request')
+        parser.add_argument('--replay', metavar='FILE',
+                            help='JSON lines file of recorded requests (method, path, body)')
+        parser.add_argument('--articles', type=int, default=1000,
+                            help='Read ids in 1..N for the synthetic mixes (see blog_seed)')
+        parser.add_argument('--method', default='GET')
+        parser.add_argument('--path', default='/api/article/')
+        parser.add_argument('--body', help='JSON request body')
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--username', default='loadtest')
+        parser.add_argument('--password', default='loadtest-password')
+        parser.add_argument('--output', metavar='FILE', help='Also write the report to FILE')
+        parser.add_argument('--baseline', metavar='FILE', help='Report to compare against')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Allowed relative slowdown before a regression is reported')
+
+    def scenario(self, options):
+        if options['replay']:
+            with open(options['replay']) as f:
+                return loadtest.ReplayScenario(f)
+        if options['mix']:
+            return loadtest.MixScenario(loadtest.MIXES[options['mix']], options['articles'])
+        body = json.loads(options['body']) if options['body'] else None
+        return loadtest.FixedScenario(options['method'].upper(), options['path'], body)
+
+    def handle(self, *args, **options):
+        report = {}
+        for target in options['target']:
+            name, sep, url = target.partition('=')
+            if not sep:
+                raise CommandError('--target must look like NAME=URL')
+            report[name] = loadtest.run(url, self.scenario(options), options['concurrency'], options['requests'],
+                                        options['username'], options['password'], options['seed'])
+        output = json.dumps(report, indent=2)
+        self.stdout.write(output)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                regressions = loadtest.compare(report, json.load(f), options['tolerance'])
+            if regressions:
+                raise CommandError('Regressions against %s:\n%s' % (options['baseline'], '\n'.join(regressions)))
@@ -0,0 +1,26 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from blog.purge import BATCH_SIZE, purge_deleted
+
+
+class Command(BaseCommand):
+    help = ('Hard-delete soft-deleted articles and their comments in small batches, '
+            'once or every --interval seconds.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-seconds', type=float, default=0, help='Only purge articles deleted at least this long ago')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--interval', type=float, default=0, help='Repeat every N seconds (0 purges once)')
+
+    def handle(self, *args, **options):
+        while True:
+            cutoff = timezone.now() - timedelta(seconds=options['grace_seconds'])
+            articles, comments = purge_deleted(cutoff, options['batch_size'])
+            self.stdout.write('Purged %d articles and %d comments' % (articles, comments))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
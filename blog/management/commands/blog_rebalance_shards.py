@@ -0,0 +1,72 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from blog import purge, shards
+from blog.models import Article, Comment, IdSequence
+from blog.transfer import preserved_timestamps
+
+
+class Command(BaseCommand):
+    help = ('Move articles (soft-deleted ones included) and their comments to the shard that owns '
+            'their bucket, after shards were added to BLOG_SHARD_URLS. Pause writes until it '
+            'finishes. Rows are copied to their new shard, then deleted from the old one, one '
+            'batch at a time; a rerun completes an interrupted move.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Articles per batch')
+        parser.add_argument('--dry-run', action='store_true', help='Only count misplaced articles')
+
+    def handle(self, *args, **options):
+        if not shards.enabled():
+            raise CommandError('BLOG_SHARD_URLS is not set')
+        if not options['dry_run']:
+            self.move_sequences()
+        moved = {'articles': 0, 'comments': 0}
+        for source in settings.BLOG_SHARDS:
+            last_id = 0
+            while True:
+                ids = list(Article.all_objects.using(source).filter(id__gt=last_id).order_by('id')
+                           .values_list('id', flat=True)[:options['batch_size']])
+                if not ids:
+                    break
+                last_id = ids[-1]
+                for target, misplaced in shards.group(ids).items():
+                    if target == source:
+                        continue
+                    moved['articles'] += len(misplaced)
+                    if not options['dry_run']:
+                        moved['comments'] += self.move(source, target, misplaced, options['batch_size'])
+        self.stdout.write('%s %d articles and %d comments' % (
+            'Would move' if options['dry_run'] else 'Moved', moved['articles'], moved['comments']))
+
+    def move_sequences(self):
+        # Each bucket's new owner continues from the highest sequence any
+        # shard has handed out for it, so no id is issued twice.
+        for bucket in range(shards.BUCKETS):
+            values = [IdSequence.objects.using(alias).filter(bucket=bucket).values_list('value', flat=True).first()
+                      for alias in settings.BLOG_SHARDS]
+            highest = max((value for value in values if value is not None), default=None)
+            if highest is not None:
+                IdSequence.objects.using(shards.owner(bucket)).update_or_create(bucket=bucket, defaults={'value': highest})
+
+    def move(self, source, target, ids, batch_size):
+        # Copies are idempotent (existing rows are kept), so a crash between
+        # the copy and the delete is repaired by running the command again.
+        comments = Comment.all_objects.using(source).filter(article_id__in=ids).order_by('id')
+        with preserved_timestamps(), transaction.atomic(using=target):
+            Article.all_objects.using(target).bulk_create(
+                list(Article.all_objects.using(source).filter(id__in=ids)), ignore_conflicts=True)
+            Comment.all_objects.using(target).bulk_create(
+                list(comments), batch_size=batch_size, ignore_conflicts=True)
+        moved = 0
+        with shards.use(source):
+            while True:
+                with transaction.atomic(using=source):
+                    batch = list(comments.values_list('id', flat=True)[:batch_size])
+                    if not batch:
+                        break
+                    moved += purge.delete_ids(Comment, batch)
+            with transaction.atomic(using=source):
+                purge.delete_ids(Article, ids)
+        return moved
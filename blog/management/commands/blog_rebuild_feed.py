@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from blog import feed
+
+
+class Command(BaseCommand):
+    help = ('Recreate the /api/feed/ table from the newest live articles. Only needed after '
+            'writes that bypass signals (blog_seed, blog_import) or to repair it.')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Feed rebuilt with %d articles' % feed.rebuild())
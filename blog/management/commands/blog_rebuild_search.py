@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+
+from blog import search, shards
+from blog.models import Article, SearchDocument
+
+
+class Command(BaseCommand):
+    help = ('Bring the article search index up to date. By default only articles whose '
+            'version differs from the indexed one are reindexed, and entries for deleted '
+            'articles are dropped; --full clears the index first.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Clear and rebuild the whole index')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        backend = search.get_backend()
+        batch_size = options['batch_size']
+        if options['full']:
+            backend.clear()
+        indexed = removed = 0
+        for alias in shards.aliases():
+            with shards.use(alias):
+                indexed += self.index_stale(backend, batch_size)
+        last_id = 0
+        while True:
+            batch = list(SearchDocument.objects.filter(article_id__gt=last_id).order_by('article_id').values_list('article_id', flat=True)[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1]
+            orphans = set(batch) - set(shards.fetch(Article.objects.values_list('id', flat=True), batch))
+            if orphans:
+                backend.remove(orphans)
+                removed += len(orphans)
+        self.stdout.write('%s: indexed %d articles, removed %d entries' % (type(backend).__name__, indexed, removed))
+
+    def index_stale(self, backend, batch_size):
+        indexed = 0
+        last_id = 0
+        while True:
+            batch = list(Article.objects.filter(id__gt=last_id).order_by('id').values_list('id', 'version')[:batch_size])
+            if not batch:
+                return indexed
+            last_id = batch[-1][0]
+            known = dict(SearchDocument.objects.filter(article_id__in=[i for i, _ in batch]).values_list('article_id', 'version'))
+            stale = [i for i, version in batch if known.get(i) != version]
+            if stale:
+                backend.index(Article.objects.filter(id__in=stale).values('id', 'title', 'content', 'version'))
+                indexed += len(stale)
@@ -0,0 +1,59 @@
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from blog import shards
+from blog.models import Article, Comment
+
+
+class Command(BaseCommand):
+    help = ('Fill the database with synthetic users, articles and comments for benchmarking. '
+            'Rows are bulk inserted and bypass signals, so run blog_rebuild_search and '
+            'blog_rebuild_feed afterwards if search or the feed is part of the benchmark.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--articles', type=int, default=1000)
+        parser.add_argument('--comments', type=int, default=5, help='Comments per article')
+        parser.add_argument('--content-size', type=int, default=1000, help='Characters of article content')
+        parser.add_argument('--password', default='loadtest-password')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options['users'] < 1:
+            raise CommandError('--users must be at least 1')
+        started = time.perf_counter()
+        batch_size = options['batch_size']
+        password = make_password(options['password'])
+        prefix = 'seed%d' % int(time.time())
+        with transaction.atomic():
+            User.objects.bulk_create(
+                [User(username='%s_%d' % (prefix, i), password=password) for i in range(options['users'])],
+                batch_size=batch_size)
+        users = list(User.objects.filter(username__startswith=prefix + '_').values_list('id', 'username'))
+        body = ('lorem ipsum dolor sit amet ' * (options['content_size'] // 27 + 1))[:options['content_size']]
+        article_ids = []
+        for start in range(0, options['articles'], batch_size):
+            count = min(batch_size, options['articles'] - start)
+            with transaction.atomic():
+                last_id = Article.objects.order_by('-id').values_list('id', flat=True).first() or 0
+                objs = shards.bulk_create(Article, [
+                    Article(title='Article %d' % (start + i), content=body, author_id=users[(start + i) % len(users)][0],
+                            author_username=users[(start + i) % len(users)][1], comment_count=options['comments'])
+                    for i in range(count)])
+                new_ids = [obj.pk for obj in objs]
+                if None in new_ids:
+                    new_ids = Article.objects.filter(id__gt=last_id).values_list('id', flat=True)
+                article_ids.extend(sorted(new_ids))
+        comments = [(article_id, i) for article_id in article_ids for i in range(options['comments'])]
+        for start in range(0, len(comments), batch_size):
+            with transaction.atomic():
+                shards.bulk_create(Comment, [
+                    Comment(article_id=article_id, content='Comment %d' % i, author_id=users[(article_id + i) % len(users)][0])
+                    for article_id, i in comments[start:start + batch_size]])
+        self.stdout.write('Seeded %d users (%s_*), %d articles (ids %s..%s), %d comments in %.1fs' % (
+            len(users), prefix, len(article_ids), article_ids[0] if article_ids else '-',
+            article_ids[-1] if article_ids else '-', len(comments), time.perf_counter() - started))
@@ -0,0 +1,36 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = ('Copy the SQLite primary database into every SQLite replica in BLOG_DB_REPLICAS, '
+            'once or every --interval seconds, to stand in for replication in local setups.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0, help='Repeat every N seconds (0 copies once)')
+
+    def handle(self, *args, **options):
+        primary = connections['default'].settings_dict
+        replicas = [connections[alias].settings_dict for alias in settings.BLOG_DB_REPLICAS]
+        if connections['default'].vendor != 'sqlite' or not replicas:
+            raise CommandError('needs a SQLite primary and at least one replica in BLOG_REPLICA_URLS')
+        while True:
+            started = time.perf_counter()
+            source = sqlite3.connect(str(primary['NAME']))
+            try:
+                for replica in replicas:
+                    target = sqlite3.connect(str(replica['NAME']))
+                    try:
+                        source.backup(target)
+                    finally:
+                        target.close()
+            finally:
+                source.close()
+            self.stdout.write('copied to %d replicas in %.1fms' % (len(replicas), (time.perf_counter() - started) * 1000))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
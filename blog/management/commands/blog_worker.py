@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog.tasks import run_pending
+
+
+class Command(BaseCommand):
+    help = ('Run queued blog tasks (search indexing, notifications). Start as many '
+            'workers as needed; each claims its own batches.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--poll-interval', type=float, default=1, help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Exit once no task is due')
+
+    def handle(self, *args, **options):
+        while True:
+            succeeded, failed = run_pending(options['batch_size'])
+            if succeeded or failed:
+                self.stdout.write('Ran %d tasks, %d failed' % (succeeded + failed, failed))
+                continue
+            if options['once']:
+                return
+            time.sleep(options['poll_interval'])
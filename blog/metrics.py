@@ -0,0 +1,128 @@
+import bisect
+from threading import Lock
+
+from . import cache
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += 1
+        self.sum += value
+
+    def quantile(self, q):
+        # Linear interpolation inside the bucket holding the q-th
+        # observation, the same estimate as Prometheus' histogram_quantile.
+        if not self.total:
+            return 0.0
+        rank = q * self.total
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.bounds[index - 1] if index else 0.0
+                upper = self.bounds[index] if index < len(self.bounds) else self.bounds[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.bounds[-1]
+
+    def cumulative(self):
+        running = 0
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            running += count
+            yield bound, running
+
+
+class RouteMetrics:
+    def __init__(self):
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.db_duration = Histogram(DURATION_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.response_bytes = Histogram(BYTES_BUCKETS)
+        self.statuses = {}
+
+
+class Registry:
+    def __init__(self):
+        self.lock = Lock()
+        self.routes = {}
+
+    def record(self, route, method, status, duration, queries, db_duration, response_bytes):
+        with self.lock:
+            metrics = self.routes.get(route)
+            if metrics is None:
+                metrics = self.routes[route] = RouteMetrics()
+            metrics.duration.observe(duration)
+            metrics.db_duration.observe(db_duration)
+            metrics.queries.observe(queries)
+            if response_bytes is not None:
+                metrics.response_bytes.observe(response_bytes)
+            key = (method, status)
+            metrics.statuses[key] = metrics.statuses.get(key, 0) + 1
+
+    def reset(self):
+        with self.lock:
+            self.routes = {}
+
+    def render(self):
+        lines = []
+        with self.lock:
+            routes = sorted(self.routes.items())
+            render_counter(lines, routes)
+            render_histogram(lines, routes, 'blog_request_duration_seconds', 'Wall time per request.', 'duration')
+            render_histogram(lines, routes, 'blog_db_duration_seconds', 'Time spent in SQL per request.', 'db_duration')
+            render_histogram(lines, routes, 'blog_db_queries', 'SQL statements per request.', 'queries')
+            render_histogram(lines, routes, 'blog_response_bytes', 'Response body size.', 'response_bytes')
+        render_cache(lines)
+        return '\n'.join(lines) + '\n'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_counter(lines, routes):
+    lines.append('# HELP blog_requests_total Requests by route, method and status.')
+    lines.append('# TYPE blog_requests_total counter')
+    for route, metrics in routes:
+        for (method, status), count in sorted(metrics.statuses.items()):
+            lines.append('blog_requests_total{route="%s",method="%s",status="%d"} %d' % (route, method, status, count))
+
+
+def render_histogram(lines, routes, name, help_text, attribute):
+    lines.append('# HELP %s %s' % (name, help_text))
+    lines.append('# TYPE %s histogram' % name)
+    for route, metrics in routes:
+        histogram = getattr(metrics, attribute)
+        for bound, count in histogram.cumulative():
+            lines.append('%s_bucket{route="%s",le="%s"} %d' % (name, route, format_value(bound), count))
+        lines.append('%s_sum{route="%s"} %s' % (name, route, format_value(histogram.sum)))
+        lines.append('%s_count{route="%s"} %d' % (name, route, histogram.total))
+    lines.append('# HELP %s_quantile Estimated %s quantiles.' % (name, name))
+    lines.append('# TYPE %s_quantile gauge' % name)
+    for route, metrics in routes:
+        histogram = getattr(metrics, attribute)
+        for q in QUANTILES:
+            lines.append('%s_quantile{route="%s",quantile="%s"} %s' % (name, route, q, format_value(histogram.quantile(q))))
+
+
+def render_cache(lines):
+    stats = cache.stats()
+    for name in ('hits', 'misses', 'sets', 'invalidations', 'evictions'):
+        lines.append('# TYPE blog_cache_%s_total counter' % name)
+        lines.append('blog_cache_%s_total %d' % (name, stats[name]))
+
+
+registry = Registry()
@@ -0,0 +1,316 @@
+import asyncio
+import contextvars
+import gzip
+import logging
+import math
+import random
+import time
+import zlib
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from . import auth, ratelimit, routers, shards
+from .metrics import registry
+
+slow_logger = logging.getLogger('blog.slow')
+
+MAX_CAPTURED_QUERIES = 100
+
+PIN_COOKIE = 'blog_pin'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson')
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.duration += elapsed
+            if len(self.statements) < MAX_CAPTURED_QUERIES:
+                self.statements.append((elapsed, sql))
+
+
+# The sampled request's recorder. A context variable rather than a wrapper
+# on this thread's connection: under ASGI the queries run on another
+# thread, which sync_to_async hands the context to.
+_recorder = contextvars.ContextVar('blog_query_recorder', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install_query_hook(sender=None, connection=None, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+connection_created.connect(install_query_hook)
+
+
+class HybridMiddleware:
+    # Runs in the mode of the chain around it, so under ASGI a request stays
+    # on the event loop rather than going through the one thread-sensitive
+    # thread, and long-polls do not queue behind each other. Subclasses do
+    # their work in enter(), leave() and finish(), inline in either mode;
+    # none of it may block.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Makes the instance a coroutine function to the handler and the
+            # middleware around it, as Django's MiddlewareMixin does.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.acall(request)
+        state = self.enter(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            self.leave(request, state)
+        return self.finish(request, response, state)
+
+    async def acall(self, request):
+        state = self.enter(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            self.leave(request, state)
+        return self.finish(request, response, state)
+
+    def enter(self, request):
+        return None
+
+    def leave(self, request, state):
+        pass
+
+    def finish(self, request, response, state):
+        return response
+
+
+class MetricsMiddleware(HybridMiddleware):
+    # Records wall time, SQL count/time, body size and status per URL name
+    # for a BLOG_METRICS_SAMPLE_RATE fraction of requests; unsampled
+    # requests only pay for one random() call.
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.sample_rate = settings.BLOG_METRICS_SAMPLE_RATE
+        self.slow_seconds = settings.BLOG_SLOW_REQUEST_MS / 1000.0
+        for conn in connections.all():
+            install_query_hook(connection=conn)
+
+    def enter(self, request):
+        if self.sample_rate <= 0 or (self.sample_rate < 1 and random.random() >= self.sample_rate):
+            return None
+        recorder = QueryRecorder()
+        return recorder, _recorder.set(recorder), time.perf_counter()
+
+    def leave(self, request, state):
+        if state is not None:
+            _recorder.reset(state[1])
+
+    def finish(self, request, response, state):
+        if state is None:
+            return response
+        recorder, _, started = state
+        duration = time.perf_counter() - started
+        match = getattr(request, 'resolver_match', None)
+        route = match.url_name if match and match.url_name else 'unmatched'
+        size = None if response.streaming else len(response.content)
+        registry.record(route, request.method, response.status_code, duration,
+                        recorder.count, recorder.duration, size)
+        if duration >= self.slow_seconds:
+            slow_logger.warning(
+                'slow request %s %s (%s) %.1fms, %d queries in %.1fms\n%s',
+                request.method, request.path, route, duration * 1000, recorder.count, recorder.duration * 1000,
+                '\n'.join('  %.2fms %s' % (elapsed * 1000, sql) for elapsed, sql in recorder.statements))
+        return response
+
+
+class ReplicaPinningMiddleware(HybridMiddleware):
+    # A client that wrote reads from the primary for BLOG_REPLICA_PIN_SECONDS
+    # afterwards, so it sees its own writes whatever the replica lag. The
+    # pin travels in a cookie holding its expiry time.
+    def __init__(self, get_response):
+        # Not MiddlewareNotUsed when off: Django 3.1.2's ASGI handler fails
+        # every request once a middleware raises it.
+        super().__init__(get_response)
+        self.enabled = bool(settings.BLOG_DB_REPLICAS)
+        self.pin_seconds = settings.BLOG_REPLICA_PIN_SECONDS
+
+    def enter(self, request):
+        if not self.enabled:
+            return None
+        writing = request.method not in SAFE_METHODS
+        try:
+            pinned_until = float(request.COOKIES.get(PIN_COOKIE, 0))
+        except ValueError:
+            pinned_until = 0
+        routers.set_pinned(writing or pinned_until > time.time())
+        return writing
+
+    def leave(self, request, writing):
+        if writing is not None:
+            routers.set_pinned(False)
+
+    def finish(self, request, response, writing):
+        if writing and response.status_code < 400:
+            response.set_cookie(PIN_COOKIE, str(int(time.time() + self.pin_seconds)),
+                                max_age=self.pin_seconds, httponly=True, samesite='Lax')
+        return response
+
+
+class ShardMiddleware(HybridMiddleware):
+    # Binds the request to the shard named by the article or comment id in
+    # the URL, so the view's queries go straight there. Other requests stay
+    # unbound and read every shard.
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.enabled = bool(settings.BLOG_SHARDS)
+
+    def leave(self, request, state):
+        if self.enabled:
+            shards.bind(None)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        pk = view_kwargs.get('article_id') or view_kwargs.get('comment_id')
+        if self.enabled and pk is not None:
+            shards.bind(shards.for_id(pk))
+        return None
+
+
+def accepted_encodings(header):
+    result = {}
+    for part in header.split(','):
+        name, _, params = part.partition(';')
+        name = name.strip().lower()
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name:
+            result[name] = quality
+    return result
+
+
+def choose_encoding(header):
+    # Highest q-value wins; brotli (when installed) before gzip on a tie.
+    accepted = accepted_encodings(header)
+    best, best_quality = None, 0.0
+    for encoding in (['br'] if brotli is not None else []) + ['gzip']:
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(encoding, data):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def compress_chunks(encoding, chunks):
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+        return
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+class CompressionMiddleware(HybridMiddleware):
+    # gzip or brotli for JSON bodies of at least BLOG_COMPRESS_MIN_BYTES,
+    # and for streamed JSON, as negotiated by Accept-Encoding.
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.min_bytes = settings.BLOG_COMPRESS_MIN_BYTES
+
+    def finish(self, request, response, state):
+        content_type = response.get('Content-Type', '')
+        if response.has_header('Content-Encoding') or not content_type.startswith(COMPRESSIBLE_TYPES):
+            return response
+        if not response.streaming and len(response.content) < self.min_bytes:
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+        if response.streaming:
+            response.streaming_content = compress_chunks(encoding, response.streaming_content)
+            del response['Content-Length']
+        else:
+            compressed = compress(encoding, response.content)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+        # The compressed bytes differ from what the strong validator named.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
+
+
+class RateLimitMiddleware(HybridMiddleware):
+    # Request counters per client (user id, or IP for anonymous requests),
+    # URL name and method, with limits from BLOG_RATE_LIMITS. Counters live
+    # in the blog cache, which settings require to be shared by every worker
+    # when limits are on; over the limit is 429 with Retry-After.
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.rules = ratelimit.compile_rules(settings.BLOG_RATE_LIMITS)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not self.rules:
+            return None
+        route = request.resolver_match.url_name or 'unmatched'
+        rule = ratelimit.find_rule(self.rules, route, request.method)
+        if rule is None:
+            return None
+        user = request.user
+        client = 'u%s' % user.pk if user.is_authenticated else 'ip%s' % auth.client_ip(request)
+        wait = ratelimit.take(ratelimit.bucket_key(route, rule, client), rule)
+        if not wait:
+            return None
+        response = HttpResponse(status=429)
+        response['Retry-After'] = str(math.ceil(wait))
+        return response
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.2 on 2026-10-18 15:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0002_timestamps_and_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['article', 'id'], name='blog_comment_article_id_idx'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 3.1.2 on 2026-10-18 15:46
+
+from django.db import migrations, models
+from django.db.utils import OperationalError
+
+
+def create_fts_table(apps, schema_editor):
+    # SQLite builds without FTS5 fall back to the SearchTerm postings.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute("CREATE VIRTUAL TABLE blog_article_fts USING fts5(title, content, tokenize='unicode61')")
+    except OperationalError:
+        pass
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS blog_article_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0003_comment_article_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('article_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('version', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('article_id', models.IntegerField(db_index=True)),
+                ('frequency', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='searchterm',
+            index=models.Index(fields=['term', 'article_id'], name='blog_searchterm_term_idx'),
+        ),
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Article = apps.get_model('blog', 'Article')
+    Comment = apps.get_model('blog', 'Comment')
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    counts = Comment.objects.filter(article=OuterRef('pk')).order_by().values('article').annotate(n=Count('id')).values('n')
+    Article.objects.update(
+        comment_count=Coalesce(Subquery(counts, output_field=IntegerField()), 0),
+        author_username=Subquery(User.objects.filter(pk=OuterRef('author_id')).values('username')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('blog', '0004_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='author_username',
+            field=models.CharField(default='', max_length=150),
+        ),
+        migrations.AddField(
+            model_name='article',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
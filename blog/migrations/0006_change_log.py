@@ -0,0 +1,31 @@
+# Generated by Django 3.1.2 on 2026-10-18 16:09
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0005_article_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('seq', models.AutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(max_length=8)),
+                ('object_id', models.IntegerField()),
+                ('action', models.CharField(max_length=8)),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ChangeHorizon',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.IntegerField(default=0)),
+            ],
+        ),
+    ]
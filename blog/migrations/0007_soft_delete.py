@@ -0,0 +1,22 @@
+# Generated by Django 3.1.2 on 2026-10-18 16:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0006_change_log'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(condition=models.Q(deleted_at__isnull=False), fields=['deleted_at'], name='blog_article_deleted_idx'),
+        ),
+    ]
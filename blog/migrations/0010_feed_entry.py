@@ -0,0 +1,42 @@
+# Generated by Django 3.1.2 on 2026-10-18 16:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_feed(apps, schema_editor):
+    Article = apps.get_model('blog', 'Article')
+    FeedEntry = apps.get_model('blog', 'FeedEntry')
+    articles = (Article.objects.using(schema_editor.connection.alias).filter(deleted_at__isnull=True)
+                .order_by('-created_at', '-id')[:settings.BLOG_FEED_SIZE])
+    FeedEntry.objects.using(schema_editor.connection.alias).bulk_create([
+        FeedEntry(article_id=a.id, created_at=a.created_at, title=a.title, excerpt=a.content[:200],
+                  author_id=a.author_id, author_username=a.author_username, comment_count=a.comment_count)
+        for a in articles])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0009_sharding'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('article_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField()),
+                ('title', models.CharField(max_length=64)),
+                ('excerpt', models.TextField()),
+                ('author_id', models.IntegerField()),
+                ('author_username', models.CharField(max_length=150)),
+                ('comment_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['-created_at', '-article_id'], name='blog_feed_recent_idx'),
+        ),
+        migrations.RunPython(fill_feed, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 3.1.2 on 2026-10-18 18:02
+
+import blog.fields
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+def copy_content(apps, schema_editor, source, target):
+    # Filled in id order, one batch at a time. CompressedTextField packs on
+    # the way in and unpacks on the way out, so both directions copy text.
+    for name in ('Article', 'Comment'):
+        model = apps.get_model('blog', name)
+        rows = model._base_manager.using(schema_editor.connection.alias).order_by('id')
+        last_id = 0
+        while True:
+            batch = list(rows.filter(id__gt=last_id).values_list('id', source)[:BATCH_SIZE])
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            rows.bulk_update([model(id=pk, **{target: content}) for pk, content in batch], [target])
+
+
+def pack_content(apps, schema_editor):
+    # A new column rather than a type change: PostgreSQL's text -> bytea
+    # cast would mangle backslashes.
+    copy_content(apps, schema_editor, 'content', 'packed_content')
+
+
+def unpack_content(apps, schema_editor):
+    copy_content(apps, schema_editor, 'packed_content', 'content')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0010_feed_entry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='packed_content',
+            field=blog.fields.CompressedTextField(null=True),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='packed_content',
+            field=blog.fields.CompressedTextField(null=True),
+        ),
+        # Nullable until it goes, so that unapplying can add it back to
+        # tables with rows in them and then fill it.
+        migrations.AlterField(
+            model_name='article',
+            name='content',
+            field=models.TextField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='content',
+            field=models.TextField(null=True),
+        ),
+        migrations.RunPython(pack_content, unpack_content),
+        migrations.RemoveField(
+            model_name='article',
+            name='content',
+        ),
+        migrations.RemoveField(
+            model_name='comment',
+            name='content',
+        ),
+        migrations.RenameField(
+            model_name='article',
+            old_name='packed_content',
+            new_name='content',
+        ),
+        migrations.RenameField(
+            model_name='comment',
+            old_name='packed_content',
+            new_name='content',
+        ),
+        migrations.AlterField(
+            model_name='article',
+            name='content',
+            field=blog.fields.CompressedTextField(),
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='content',
+            field=blog.fields.CompressedTextField(),
+        ),
+    ]
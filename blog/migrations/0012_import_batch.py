@@ -0,0 +1,26 @@
+# Generated by Django 3.1.2 on 2026-10-18 17:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0011_compressed_content'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportBatch',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('run', models.CharField(max_length=100)),
+                ('position', models.PositiveIntegerField()),
+                ('ids', models.JSONField(default=dict)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='importbatch',
+            index=models.Index(fields=['run', 'position'], name='blog_importbatch_run_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.1.2 on 2026-10-18 17:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0012_import_batch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SigninFailure',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=200, unique=True)),
+                ('count', models.PositiveIntegerField(default=1)),
+                ('window_ends', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
@@ -1,13 +1,228 @@
-from django.db import models
+from collections import Counter
+
+from django.db import models, router, transaction
+from django.db.models import F
 from django.conf import settings
+from django.utils import timezone
+
+from . import cache, shards
+from .fields import CompressedTextField
 # Create your models here.
 
-class Article(models.Model):
+class VersionedModel(models.Model):
+  created_at = models.DateTimeField(auto_now_add=True)
+  updated_at = models.DateTimeField(auto_now=True)
+  version = models.PositiveIntegerField(default=1)
+
+  class Meta:
+    abstract = True
+
+  def save(self, *args, **kwargs):
+    if not self._state.adding:
+      self.version += 1
+      update_fields = kwargs.get('update_fields')
+      if update_fields is not None:
+        kwargs['update_fields'] = set(update_fields) | {'version', 'updated_at'}
+    elif self.pk is None and shards.enabled():
+      self.pk = shards.allocate(self.shard_bucket())
+      kwargs['force_insert'] = True
+    # post_save receivers (change log, comment counts, search index) write
+    # in the same transaction as the row itself, and on the same shard.
+    using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+    with shards.use(shards.for_id(self.pk)), transaction.atomic(using=using):
+      super().save(*args, **kwargs)
+
+  def shard_bucket(self):
+    # Bucket for a new id (see blog.shards); None picks one at random.
+    return None
+
+class ArticleQuerySet(models.QuerySet):
+  def soft_delete(self):
+    # Constant time whatever the number of comments; blog_purge_deleted
+    # removes the rows later.
+    return self.update(deleted_at=timezone.now())
+
+class LiveArticleManager(models.Manager.from_queryset(ArticleQuerySet)):
+  def get_queryset(self):
+    return super().get_queryset().filter(deleted_at__isnull=True)
+
+class Article(VersionedModel):
   title = models.CharField(max_length=64)
-  content = models.TextField()
-  author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+  # Long bodies are stored gzipped; see blog.fields.
+  content = CompressedTextField()
+  # Users stay on the default database, so no constraint on shards.
+  author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_constraint=False)
+  # Denormalized so list and detail pages need no join or aggregate.
+  # comment_count only ever changes through adjust_comment_counts().
+  author_username = models.CharField(max_length=150, default='')
+  comment_count = models.PositiveIntegerField(default=0)
+  deleted_at = models.DateTimeField(null=True, blank=True)
+
+  objects = LiveArticleManager()
+  all_objects = ArticleQuerySet.as_manager()
 
-class Comment(models.Model):
+  class Meta:
+    indexes = [
+      models.Index(fields=['deleted_at'], name='blog_article_deleted_idx', condition=models.Q(deleted_at__isnull=False)),
+    ]
+
+  def save(self, *args, **kwargs):
+    if self._state.adding:
+      if not self.author_username:
+        self.author_username = self.author.username
+    elif kwargs.get('update_fields') is None:
+      kwargs['update_fields'] = [f.name for f in self._meta.concrete_fields
+                                 if not f.primary_key and f.name != 'comment_count']
+    super().save(*args, **kwargs)
+
+def adjust_comment_counts(deltas):
+  # ``deltas`` maps article ids to the change in their comment count; one
+  # UPDATE per distinct delta, in the caller's transaction.
+  by_delta = {}
+  for article_id, delta in deltas.items():
+    if delta:
+      by_delta.setdefault(delta, []).append(article_id)
+  now = timezone.now()
+  for delta, ids in by_delta.items():
+    for alias, shard_ids in shards.group(ids).items():
+      Article.objects.using(alias).filter(id__in=shard_ids).update(comment_count=F('comment_count') + delta, updated_at=now)
+    FeedEntry.objects.filter(article_id__in=ids).update(comment_count=F('comment_count') + delta)
+  for alias, ids in shards.group(deltas).items():
+    cache.invalidate('article', *ids, using=alias)
+
+class CommentQuerySet(models.QuerySet):
+  def delete(self):
+    # Cascades from a deleted article do not come through here, so they do
+    # not pay for updating a row that is about to disappear.
+    with transaction.atomic(using=self.db):
+      deltas = Counter(self.values_list('article_id', flat=True))
+      result = super().delete()
+      adjust_comment_counts({article_id: -n for article_id, n in deltas.items()})
+    return result
+
+class LiveCommentManager(models.Manager.from_queryset(CommentQuerySet)):
+  def get_queryset(self):
+    return super().get_queryset().filter(article__deleted_at__isnull=True)
+
+class Comment(VersionedModel):
   article = models.ForeignKey(Article, on_delete=models.CASCADE)
-  content = models.TextField()
-  author = models.ForeignKey(settings.AUTH_USER_MODEL,on_delete=models.CASCADE)
+  content = CompressedTextField()
+  author = models.ForeignKey(settings.AUTH_USER_MODEL,on_delete=models.CASCADE, db_constraint=False)
+
+  # Comments of a soft-deleted article disappear with it.
+  objects = LiveCommentManager()
+  all_objects = CommentQuerySet.as_manager()
+
+  def shard_bucket(self):
+    return shards.bucket(self.article_id)
+
+  def delete(self, *args, **kwargs):
+    with transaction.atomic(using=kwargs.get('using') or router.db_for_write(type(self), instance=self)):
+      result = super().delete(*args, **kwargs)
+      adjust_comment_counts({self.article_id: -1})
+    return result
+
+  class Meta:
+    indexes = [
+      models.Index(fields=['article', 'id'], name='blog_comment_article_id_idx'),
+    ]
+
+class SearchDocument(models.Model):
+  # Article version last written to the search index; lets the rebuild
+  # command find stale or orphaned entries without reading the index.
+  article_id = models.IntegerField(primary_key=True)
+  version = models.PositiveIntegerField()
+
+class SearchTerm(models.Model):
+  # Postings for the portable search backend (databases without FTS5).
+  term = models.CharField(max_length=64)
+  article_id = models.IntegerField(db_index=True)
+  frequency = models.PositiveIntegerField()
+
+  class Meta:
+    indexes = [
+      models.Index(fields=['term', 'article_id'], name='blog_searchterm_term_idx'),
+    ]
+
+class FeedEntry(models.Model):
+  # The newest live articles, ready to serve from /api/feed/ without
+  # touching blog_article; maintained by blog.feed.
+  article_id = models.IntegerField(primary_key=True)
+  created_at = models.DateTimeField()
+  title = models.CharField(max_length=64)
+  excerpt = models.TextField()
+  author_id = models.IntegerField()
+  author_username = models.CharField(max_length=150)
+  comment_count = models.PositiveIntegerField(default=0)
+
+  class Meta:
+    indexes = [
+      models.Index(fields=['-created_at', '-article_id'], name='blog_feed_recent_idx'),
+    ]
+
+class Change(models.Model):
+  # Append-only log behind /api/changes/. seq is never reused (SQLite
+  # AUTOINCREMENT, PostgreSQL sequences) and is only assigned by
+  # blog.changelog.relay, so clients resume from the last seq they saw.
+  seq = models.AutoField(primary_key=True)
+  kind = models.CharField(max_length=8)
+  object_id = models.IntegerField()
+  action = models.CharField(max_length=8)
+  created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+class ChangeHorizon(models.Model):
+  # Highest seq removed by blog_compact_changes; a client that has not
+  # seen it yet has missed entries and must resync.
+  seq = models.IntegerField(default=0)
+
+class PendingChange(models.Model):
+  # Outbox written in the same transaction as the row it describes, on that
+  # row's database (its shard when sharded). blog.changelog.relay moves
+  # committed entries into Change, so a rolled-back write is never logged and
+  # seqs are handed out in commit order.
+  kind = models.CharField(max_length=8)
+  object_id = models.IntegerField()
+  action = models.CharField(max_length=8)
+  created_at = models.DateTimeField(default=timezone.now)
+
+class Task(models.Model):
+  # Queued by blog.tasks.enqueue and run by the blog_worker command.
+  name = models.CharField(max_length=64)
+  kwargs = models.JSONField(default=dict)
+  attempts = models.PositiveSmallIntegerField(default=0)
+  run_after = models.DateTimeField(default=timezone.now)
+  locked_until = models.DateTimeField(null=True, blank=True)
+  failed_at = models.DateTimeField(null=True, blank=True)
+  last_error = models.TextField(blank=True, default='')
+  created_at = models.DateTimeField(default=timezone.now)
+
+  class Meta:
+    indexes = [
+      models.Index(fields=['run_after'], name='blog_task_due_idx', condition=models.Q(failed_at__isnull=True)),
+    ]
+
+class ImportBatch(models.Model):
+  # One committed blog_import batch of the run named by --checkpoint,
+  # written in the batch's own transaction: the input position reached
+  # and the new ids the batch assigned, by record type.
+  run = models.CharField(max_length=100)
+  position = models.PositiveIntegerField()
+  ids = models.JSONField(default=dict)
+
+  class Meta:
+    indexes = [
+      models.Index(fields=['run', 'position'], name='blog_importbatch_run_idx'),
+    ]
+
+class IdSequence(models.Model):
+  # Next free sequence number of a shard bucket, kept on the shard that
+  # owns the bucket; see blog.shards.allocate.
+  bucket = models.PositiveSmallIntegerField(primary_key=True)
+  value = models.BigIntegerField(default=1)
+
+class SigninFailure(models.Model):
+  # Failed signins per username or client IP (see blog.auth), counted in
+  # the database so that every worker process sees the same numbers.
+  key = models.CharField(max_length=200, unique=True)
+  count = models.PositiveIntegerField(default=1)
+  window_ends = models.DateTimeField(db_index=True)
@@ -0,0 +1,77 @@
+import base64
+import binascii
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+# Ids and sequence numbers from clients must fit a signed 64-bit column.
+MAX_ID = 2 ** 63 - 1
+
+
+class InvalidPage(ValueError):
+    pass
+
+
+def encode_cursor(last_id):
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip('=')
+
+
+def decode_text(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        return base64.urlsafe_b64decode(padded.encode()).decode()
+    except (binascii.Error, UnicodeDecodeError):
+        raise InvalidPage('invalid cursor')
+
+
+def in_range(value):
+    return 0 <= value <= MAX_ID
+
+
+def decode_cursor(cursor):
+    try:
+        last_id = int(decode_text(cursor))
+    except ValueError:
+        raise InvalidPage('invalid cursor')
+    if not in_range(last_id):
+        raise InvalidPage('invalid cursor')
+    return last_id
+
+
+def is_paginated(request):
+    return 'limit' in request.GET or 'cursor' in request.GET
+
+
+def page_params(request, decode=decode_cursor):
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise InvalidPage('invalid limit')
+    if limit < 1:
+        raise InvalidPage('invalid limit')
+    cursor = request.GET.get('cursor')
+    after = decode(cursor) if cursor else None
+    return min(limit, MAX_LIMIT), after
+
+
+def keyset_page(queryset, limit, after=None, descending=False):
+    # Seeks past the last seen id instead of using OFFSET, so every page
+    # costs one indexed range scan no matter how deep the client is.
+    if after is not None:
+        queryset = queryset.filter(id__lt=after) if descending else queryset.filter(id__gt=after)
+    queryset = queryset.order_by('-id' if descending else 'id')
+    rows = list(queryset[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last['id'] if isinstance(last, dict) else last.id)
+    return rows, next_cursor
+
+
+def set_next_link(request, response, next_cursor):
+    if next_cursor is not None:
+        params = request.GET.copy()
+        params['cursor'] = next_cursor
+        response['X-Next-Cursor'] = next_cursor
+        response['Link'] = '<%s?%s>; rel="next"' % (request.path, params.urlencode())
+    return response
@@ -0,0 +1,52 @@
+from django.db import connections, router, transaction
+
+from . import shards
+from .models import Article, Comment
+
+BATCH_SIZE = 500
+
+
+def delete_ids(model, ids):
+    # Raw DELETE: no per-row signals, counters or change log entries; the
+    # rows are already invisible through the default managers.
+    connection = connections[router.db_for_write(model)]
+    table = connection.ops.quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s WHERE id IN (%s)' % (table, ', '.join(['%s'] * len(ids))), ids)
+        return cursor.rowcount
+
+
+def purge_deleted(cutoff, batch_size=BATCH_SIZE):
+    # Hard-deletes articles soft-deleted before ``cutoff`` and their
+    # comments, one short transaction per batch so writers are never held
+    # up for long. Returns (articles, comments) removed.
+    articles = comments = 0
+    for alias in shards.aliases():
+        with shards.use(alias):
+            removed = purge_shard(cutoff, batch_size)
+        articles, comments = articles + removed[0], comments + removed[1]
+    return articles, comments
+
+
+def purge_shard(cutoff, batch_size):
+    articles = comments = 0
+    using = router.db_for_write(Article)
+    while True:
+        tombstones = list(Article.all_objects.filter(deleted_at__lt=cutoff).order_by('deleted_at').values_list('id', flat=True)[:batch_size])
+        if not tombstones:
+            return articles, comments
+        while True:
+            with transaction.atomic(using=using):
+                batch = list(Comment.all_objects.filter(article_id__in=tombstones).values_list('id', flat=True)[:batch_size])
+                if not batch:
+                    break
+                comments += delete_ids(Comment, batch)
+        with transaction.atomic(using=using):
+            # The article rows are locked first, then any comment added since
+            # the batches above goes with them.
+            tombstones = list(Article.all_objects.select_for_update().filter(id__in=tombstones).values_list('id', flat=True))
+            stragglers = list(Comment.all_objects.filter(article_id__in=tombstones).values_list('id', flat=True))
+            if stragglers:
+                comments += delete_ids(Comment, stragglers)
+            if tombstones:
+                articles += delete_ids(Article, tombstones)
@@ -0,0 +1,52 @@
+import math
+import time
+
+from . import cache
+
+ANY = '*'
+
+
+def compile_rules(limits):
+    # {url name: {method: (requests per second, burst)}} -> the same keyed
+    # by (url name, method), as (method, requests per window, window in
+    # seconds). ANY matches every url name or method not listed.
+    rules = {}
+    for route, methods in limits.items():
+        for method, (rate, burst) in methods.items():
+            rules[route, method] = (method, burst, burst / rate)
+    return rules
+
+
+def find_rule(rules, route, method):
+    return (rules.get((route, method)) or rules.get((route, ANY))
+            or rules.get((ANY, method)) or rules.get((ANY, ANY)))
+
+
+def bucket_key(route, rule, client):
+    # Each url name has its own counters; methods matched by ANY share them.
+    return 'blog:rate:%s:%s:%s' % (route, rule[0], client)
+
+
+def take(key, rule, now=None):
+    # A counter per fixed window, named by the window's number so that an
+    # entry outliving it (file caches reset the timeout on incr) is never
+    # read again. add() and incr() keep it exact when several requests
+    # race, given a cache whose incr is atomic (redis; locmem within one
+    # process). Returns 0 when allowed, else the seconds to wait.
+    _, limit, window = rule
+    now = time.time() if now is None else now
+    number = math.floor(now / window)
+    window_key = '%s:%d' % (key, number)
+    backend = cache.get_cache()
+    if backend.add(window_key, 1, math.ceil(window) + 1):
+        count = 1
+    else:
+        try:
+            count = backend.incr(window_key)
+        except ValueError:
+            # Expired between the two calls.
+            backend.add(window_key, 1, math.ceil(window) + 1)
+            count = 1
+    if count > limit:
+        return (number + 1) * window - now
+    return 0
@@ -0,0 +1,88 @@
+import random
+import threading
+import time
+
+from asgiref.local import Local
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+from . import shards
+
+# Whether the current request must read from the primary; set by
+# blog.middleware.ReplicaPinningMiddleware.
+_state = Local()
+
+_health = {}
+_health_lock = threading.Lock()
+
+
+def set_pinned(pinned):
+    _state.pinned = pinned
+
+
+def is_pinned():
+    return getattr(_state, 'pinned', False)
+
+
+def record_health(alias, healthy):
+    with _health_lock:
+        _health[alias] = (time.monotonic(), healthy)
+
+
+def replica_healthy(alias):
+    # Probed at most once per BLOG_REPLICA_CHECK_INTERVAL per process; a
+    # replica that is down, or missing the blog tables, serves no reads.
+    with _health_lock:
+        checked = _health.get(alias)
+    if checked and time.monotonic() - checked[0] < settings.BLOG_REPLICA_CHECK_INTERVAL:
+        return checked[1]
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT 1 FROM blog_article LIMIT 1')
+        healthy = True
+    except DatabaseError:
+        connections[alias].close()
+        healthy = False
+    record_health(alias, healthy)
+    return healthy
+
+
+class ShardRouter:
+    # Articles and comments go to the shard their id maps to, or, for
+    # queries without an instance, to the shard the request is bound to
+    # (blog.shards.use). Other models, and everything when BLOG_SHARDS is
+    # empty, fall through to the next router.
+    def db_for_read(self, model, **hints):
+        if not shards.enabled() or not shards.routed(model):
+            return None
+        instance = hints.get('instance')
+        if instance is not None and shards.routed(instance) and instance.pk is not None:
+            return shards.for_id(instance.pk)
+        return shards.current()
+
+    def db_for_write(self, model, **hints):
+        return self.db_for_read(model, **hints)
+
+
+class ReplicaRouter:
+    # Reads of blog models go to a random healthy replica in
+    # BLOG_DB_REPLICAS, unless the request is pinned to the primary or
+    # the read is part of a transaction there; everything else uses the
+    # default database.
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != 'blog':
+            return None
+        if is_pinned() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        replicas = [alias for alias in settings.BLOG_DB_REPLICAS if replica_healthy(alias)]
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.BLOG_DB_REPLICAS
@@ -0,0 +1,78 @@
+from django.conf import settings
+
+from . import codec
+from .models import Article
+
+
+class PayloadError(ValueError):
+    status = 400
+
+
+class PayloadTooLarge(PayloadError):
+    status = 413
+
+
+def read_json(request, max_bytes=None):
+    # Refuses oversized bodies before reading them when Content-Length says
+    # so, then decodes the body exactly once.
+    max_bytes = max_bytes or settings.BLOG_MAX_BODY_BYTES
+    try:
+        declared = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        declared = 0
+    if declared > max_bytes:
+        raise PayloadTooLarge('body exceeds %d bytes' % max_bytes)
+    body = request.body
+    if len(body) > max_bytes:
+        raise PayloadTooLarge('body exceeds %d bytes' % max_bytes)
+    try:
+        return codec.loads(body)
+    except ValueError:
+        raise PayloadError('malformed JSON')
+
+
+class Field:
+    def __init__(self, kind=str, max_length=None):
+        self.kind = kind
+        self.max_length = max_length
+
+    def clean(self, name, value):
+        if not isinstance(value, self.kind) or isinstance(value, bool):
+            raise PayloadError('%s has the wrong type' % name)
+        if self.max_length is not None and len(value) > self.max_length:
+            raise PayloadError('%s is longer than %d characters' % (name, self.max_length))
+        return value
+
+
+class Schema:
+    fields = {}
+
+    def __init__(self, **values):
+        self.__dict__.update(values)
+
+    @classmethod
+    def from_data(cls, data):
+        if not isinstance(data, dict):
+            raise PayloadError('expected a JSON object')
+        values = {}
+        for name, field in cls.fields.items():
+            if name not in data:
+                raise PayloadError('%s is required' % name)
+            values[name] = field.clean(name, data[name])
+        return cls(**values)
+
+    @classmethod
+    def parse(cls, request):
+        return cls.from_data(read_json(request))
+
+
+class Credentials(Schema):
+    fields = {'username': Field(str, max_length=150), 'password': Field(str)}
+
+
+class ArticlePayload(Schema):
+    fields = {'title': Field(str, max_length=Article._meta.get_field('title').max_length), 'content': Field(str)}
+
+
+class CommentPayload(Schema):
+    fields = {'content': Field(str)}
@@ -0,0 +1,172 @@
+import math
+import re
+from collections import Counter
+
+from django.db import connection, transaction
+
+from . import shards
+from .models import Article, SearchDocument, SearchTerm
+
+FTS_TABLE = 'blog_article_fts'
+TITLE_WEIGHT = 3
+SNIPPET_CHARS = 160
+MAX_QUERY_TERMS = 8
+
+_word = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    return _word.findall(text.lower())
+
+
+_fts5_databases = set()
+
+
+def fts5_available(conn=connection):
+    # Only positive answers are remembered, so a database migrated after the
+    # first lookup still switches over to FTS5.
+    if conn.vendor != 'sqlite':
+        return False
+    if conn.settings_dict['NAME'] in _fts5_databases:
+        return True
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        found = cursor.fetchone() is not None
+    if found:
+        _fts5_databases.add(conn.settings_dict['NAME'])
+    return found
+
+
+def get_backend():
+    return FtsBackend() if fts5_available() else PostingsBackend()
+
+
+class SearchBackend:
+    def index(self, articles):
+        # ``articles`` are dicts with id, title, content and version.
+        articles = list(articles)
+        if not articles:
+            return
+        with transaction.atomic():
+            self.remove_terms([a['id'] for a in articles])
+            self.add_terms(articles)
+            SearchDocument.objects.filter(article_id__in=[a['id'] for a in articles]).delete()
+            SearchDocument.objects.bulk_create(
+                [SearchDocument(article_id=a['id'], version=a['version']) for a in articles])
+
+    def remove(self, ids):
+        ids = list(ids)
+        if not ids:
+            return
+        with transaction.atomic():
+            self.remove_terms(ids)
+            SearchDocument.objects.filter(article_id__in=ids).delete()
+
+    def clear(self):
+        with transaction.atomic():
+            self.clear_terms()
+            SearchDocument.objects.all().delete()
+
+
+class FtsBackend(SearchBackend):
+    # SQLite FTS5 keeps its own copy of title and content so that bm25()
+    # ranking and snippet() work without touching blog_article.
+    def add_terms(self, articles):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                'INSERT INTO %s (rowid, title, content) VALUES (%%s, %%s, %%s)' % FTS_TABLE,
+                [(a['id'], a['title'], a['content']) for a in articles])
+
+    def remove_terms(self, ids):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM %s WHERE rowid IN (%s)' % (FTS_TABLE, ', '.join(['%s'] * len(ids))), ids)
+
+    def clear_terms(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM %s' % FTS_TABLE)
+
+    def search(self, query, limit, offset):
+        terms = tokenize(query)[:MAX_QUERY_TERMS]
+        if not terms:
+            return []
+        match = ' '.join('"%s"' % term for term in terms)
+        # Sharded articles are not on this database; their authors are
+        # looked up on the shards instead of joined. Soft-deleted articles
+        # drop out here even before remove_articles has run.
+        author = 'NULL' if shards.enabled() else 'a.author_id'
+        join = '' if shards.enabled() else 'JOIN blog_article a ON a.id = f.rowid AND a.deleted_at IS NULL '
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT f.rowid, f.title, snippet(%(t)s, 1, '<b>', '</b>', '...', 24), "
+                "bm25(%(t)s, %(w)d.0, 1.0) AS score, %(a)s "
+                "FROM %(t)s f %(j)s"
+                "WHERE %(t)s MATCH %%s ORDER BY score LIMIT %%s OFFSET %%s" % {
+                    't': FTS_TABLE, 'w': TITLE_WEIGHT, 'a': author, 'j': join},
+                [match, limit, offset])
+            rows = cursor.fetchall()
+        if shards.enabled():
+            authors = dict(shards.fetch(Article.objects.values_list('id', 'author_id'), [r[0] for r in rows]))
+            rows = [r[:4] + (authors[r[0]],) for r in rows if r[0] in authors]
+        # bm25() is lower-is-better; flip it so both backends rank descending.
+        return [{'id': r[0], 'title': r[1], 'snippet': r[2], 'score': round(-r[3], 4), 'author': r[4]} for r in rows]
+
+
+class PostingsBackend(SearchBackend):
+    # Portable inverted index in an ordinary table, ranked with tf-idf in
+    # Python; used on databases without FTS5.
+    def add_terms(self, articles):
+        postings = []
+        for article in articles:
+            counts = Counter(tokenize(article['content']))
+            for term in tokenize(article['title']):
+                counts[term] += TITLE_WEIGHT
+            postings.extend(SearchTerm(term=term[:64], article_id=article['id'], frequency=count)
+                            for term, count in counts.items())
+        SearchTerm.objects.bulk_create(postings, batch_size=1000)
+
+    def remove_terms(self, ids):
+        SearchTerm.objects.filter(article_id__in=ids).delete()
+
+    def clear_terms(self):
+        SearchTerm.objects.all().delete()
+
+    def search(self, query, limit, offset):
+        terms = list(dict.fromkeys(t[:64] for t in tokenize(query)))[:MAX_QUERY_TERMS]
+        if not terms:
+            return []
+        total = SearchDocument.objects.count() or 1
+        scores, matched = Counter(), Counter()
+        for term in terms:
+            postings = list(SearchTerm.objects.filter(term=term).values_list('article_id', 'frequency'))
+            idf = math.log(1 + total / (len(postings) or 1))
+            for article_id, frequency in postings:
+                scores[article_id] += (1 + math.log(frequency)) * idf
+                matched[article_id] += 1
+        ranked = sorted((a for a in scores if matched[a] == len(terms)), key=lambda a: (-scores[a], a))
+        page = ranked[offset:offset + limit]
+        articles = {a.id: a for a in shards.fetch(Article.objects.all(), page)}
+        return [{'id': a, 'title': articles[a].title, 'snippet': make_snippet(articles[a].content, terms),
+                 'score': round(scores[a], 4), 'author': articles[a].author_id} for a in page if a in articles]
+
+
+def make_snippet(content, terms):
+    lowered = content.lower()
+    positions = [p for p in (lowered.find(term) for term in terms) if p >= 0]
+    start = max(min(positions, default=0) - SNIPPET_CHARS // 4, 0)
+    snippet = content[start:start + SNIPPET_CHARS]
+    return ('...' if start else '') + snippet + ('...' if start + SNIPPET_CHARS < len(content) else '')
+
+
+def document(article):
+    return {'id': article.pk, 'title': article.title, 'content': article.content, 'version': article.version}
+
+
+def index_articles(ids):
+    backend = get_backend()
+    articles = shards.fetch(Article.objects.values('id', 'title', 'content', 'version'), ids)
+    backend.index(articles)
+    backend.remove(set(ids) - {a['id'] for a in articles})
+
+
+def remove_articles(ids):
+    get_backend().remove(ids)
@@ -0,0 +1,224 @@
+import contextlib
+import heapq
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.local import Local
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+
+from . import pagination
+
+# Articles and comments are spread over the BLOG_SHARDS databases by id:
+# an id is seq * BUCKETS + bucket, and each bucket belongs to one shard. A
+# comment takes its article's bucket, so an article and its comments always
+# share a shard, and any article or comment id names its shard without a
+# lookup. BUCKETS is part of every stored id and can never change.
+BUCKETS = 64
+ROUTED = ('blog.article', 'blog.comment')
+# Ids reserved per round trip to a bucket's sequence row.
+BLOCK_SIZE = 100
+WORKERS_PER_SHARD = 4
+
+# The shard queries without an instance go to; set by
+# blog.middleware.ShardMiddleware from the URL, or with use().
+_state = Local()
+
+_blocks = {}
+_blocks_lock = threading.Lock()
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def enabled():
+    return bool(settings.BLOG_SHARDS)
+
+
+def aliases():
+    # [None] without sharding, so loops over shards also run unsharded.
+    return list(settings.BLOG_SHARDS) or [None]
+
+
+def routed(model):
+    # A model class or instance.
+    return model._meta.label_lower in ROUTED
+
+
+def bucket(pk):
+    return int(pk) % BUCKETS
+
+
+def owner(bucket):
+    return settings.BLOG_SHARDS[bucket % len(settings.BLOG_SHARDS)]
+
+
+def for_id(pk):
+    return owner(bucket(pk)) if enabled() else None
+
+
+def group(ids):
+    # {alias: ids} by owning shard; {None: ids} without sharding.
+    if not enabled():
+        return {None: list(ids)}
+    groups = {}
+    for pk in ids:
+        groups.setdefault(for_id(pk), []).append(pk)
+    return groups
+
+
+def bind(alias):
+    _state.alias = alias
+
+
+def current():
+    return getattr(_state, 'alias', None)
+
+
+@contextlib.contextmanager
+def use(alias):
+    previous = current()
+    bind(alias)
+    try:
+        yield
+    finally:
+        bind(previous)
+
+
+def pick_bucket():
+    # A random bucket of the current shard, or of any shard.
+    alias = current()
+    return random.choice([b for b in range(BUCKETS) if alias is None or owner(b) == alias])
+
+
+def reserve(bucket, count):
+    # Advances the bucket's sequence, kept on the shard that owns it, and
+    # returns the reserved [start, end) range.
+    from .models import IdSequence
+
+    alias = owner(bucket)
+    sequences = IdSequence.objects.using(alias)
+    with transaction.atomic(using=alias):
+        while not sequences.filter(bucket=bucket).update(value=F('value') + count):
+            sequences.bulk_create([IdSequence(bucket=bucket)], ignore_conflicts=True)
+        end = sequences.filter(bucket=bucket).values_list('value', flat=True).get()
+    return end - count, end
+
+
+def allocate(bucket=None):
+    if bucket is None:
+        bucket = pick_bucket()
+    if connections[owner(bucket)].in_atomic_block:
+        # A range reserved inside the caller's transaction is undone if that
+        # rolls back, so it must not be handed out again later.
+        return allocate_many(bucket, 1)[0]
+    with _blocks_lock:
+        start, end = _blocks.get(bucket, (0, 0))
+        if start == end:
+            start, end = reserve(bucket, BLOCK_SIZE)
+        _blocks[bucket] = (start + 1, end)
+    return start * BUCKETS + bucket
+
+
+def allocate_many(bucket, count):
+    start, end = reserve(bucket, count)
+    return [seq * BUCKETS + bucket for seq in range(start, end)]
+
+
+def assign_ids(objs):
+    # Gives every object without a pk an id, one reservation per bucket.
+    pending = {}
+    for obj in objs:
+        if obj.pk is None:
+            hint = obj.shard_bucket()
+            pending.setdefault(pick_bucket() if hint is None else hint, []).append(obj)
+    for b, group_objs in pending.items():
+        for obj, pk in zip(group_objs, allocate_many(b, len(group_objs))):
+            obj.pk = pk
+
+
+def bulk_create(model, objs, **kwargs):
+    # bulk_create() onto the owning shards, one batch per shard. Without
+    # sharding this is plain bulk_create() (no pks back on SQLite).
+    if not enabled():
+        return model.objects.bulk_create(objs, **kwargs)
+    assign_ids(objs)
+    by_alias = {}
+    for obj in objs:
+        by_alias.setdefault(for_id(obj.pk), []).append(obj)
+    for alias, group_objs in by_alias.items():
+        model.objects.using(alias).bulk_create(group_objs, **kwargs)
+    return objs
+
+
+def executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=WORKERS_PER_SHARD * max(len(settings.BLOG_SHARDS), 1),
+                                           thread_name_prefix='blog-shards')
+        return _executor
+
+
+def in_worker(func, item):
+    # Pool threads keep their own connections; drop broken or expired ones
+    # the way request_finished does for request threads.
+    for conn in connections.all():
+        conn.close_if_unusable_or_obsolete()
+    return func(item)
+
+
+def gather(func, items):
+    # func(item) for every item, in parallel when there is more than one;
+    # results are in the order of items.
+    items = list(items)
+    if len(items) < 2:
+        return [func(item) for item in items]
+    return list(executor().map(in_worker, [func] * len(items), items))
+
+
+def querysets(queryset):
+    # One queryset per shard for a scatter-gather read; just ``queryset``
+    # when unsharded, not a sharded model, or already bound to a shard.
+    if not enabled() or not routed(queryset.model) or current() is not None:
+        return [queryset]
+    return [queryset.using(alias) for alias in settings.BLOG_SHARDS]
+
+
+def fetch(queryset, ids):
+    # The rows of ``queryset`` with the given ids, each read from its shard.
+    groups = group(ids)
+    results = gather(lambda item: list(queryset.using(item[0]).filter(id__in=item[1])), groups.items())
+    return [row for rows in results for row in rows]
+
+
+def row_id(row):
+    # A model instance, a values() dict or a values_list() tuple led by id.
+    if isinstance(row, dict):
+        return row['id']
+    return row[0] if isinstance(row, tuple) else row.id
+
+
+def ordered(queryset):
+    # Every row, in id order, merged from all shards.
+    results = gather(lambda qs: list(qs.order_by('id')), querysets(queryset))
+    return results[0] if len(results) == 1 else list(heapq.merge(*results, key=row_id))
+
+
+def iterator(queryset, chunk_size):
+    # Streaming version of ordered(); each shard is read with its own cursor.
+    iterators = [qs.order_by('id').iterator(chunk_size=chunk_size) for qs in querysets(queryset)]
+    return iterators[0] if len(iterators) == 1 else heapq.merge(*iterators, key=row_id)
+
+
+def keyset_page(queryset, limit, after=None):
+    # Each shard returns its own first page after ``after``; the merged page
+    # is the lowest ``limit`` ids among them.
+    pages = gather(lambda qs: pagination.keyset_page(qs, limit, after), querysets(queryset))
+    if len(pages) == 1:
+        return pages[0]
+    rows = list(heapq.merge(*(rows for rows, _ in pages), key=row_id))
+    more = len(rows) > limit or any(next_cursor for _, next_cursor in pages)
+    rows = rows[:limit]
+    return rows, pagination.encode_cursor(row_id(rows[-1])) if more else None
@@ -0,0 +1,127 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.signals import user_logged_out
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from . import auth, cache, changelog, feed, shards, tasks
+from .models import Article, Comment, FeedEntry, adjust_comment_counts
+
+# Sent by code paths that write through QuerySet.update() and therefore
+# bypass post_save; receivers get ``pks`` and ``action``.
+rows_changed = Signal()
+
+
+@receiver(post_save, sender=Article)
+@receiver(post_delete, sender=Article)
+def invalidate_article(sender, instance, using, **kwargs):
+    cache.invalidate('article', instance.pk, using=using)
+
+
+@receiver(post_save, sender=Article)
+def index_article(sender, instance, **kwargs):
+    tasks.enqueue('index_articles', ids=[instance.pk])
+
+
+@receiver(post_delete, sender=Article)
+def unindex_article(sender, instance, **kwargs):
+    tasks.enqueue('remove_articles', ids=[instance.pk])
+
+
+@receiver(post_save, sender=Article)
+def update_feed(sender, instance, created, **kwargs):
+    if created:
+        feed.add(instance)
+    else:
+        feed.update(instance)
+
+
+@receiver(post_delete, sender=Article)
+def remove_from_feed(sender, instance, **kwargs):
+    feed.remove([instance.pk])
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment(sender, instance, using, **kwargs):
+    cache.invalidate('comment', instance.pk, using=using)
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, **kwargs):
+    if created:
+        adjust_comment_counts({instance.article_id: 1})
+
+
+@receiver(post_save, sender=Comment)
+def notify_comment(sender, instance, created, **kwargs):
+    if created:
+        tasks.enqueue('notify_comments', ids=[instance.pk])
+
+
+@receiver(post_save, sender=Article)
+@receiver(post_save, sender=Comment)
+def log_save(sender, instance, created, using, **kwargs):
+    changelog.record(sender, [instance.pk], 'create' if created else 'update', using=using)
+
+
+@receiver(post_delete, sender=Article)
+@receiver(post_delete, sender=Comment)
+def log_delete(sender, instance, using, **kwargs):
+    changelog.record(sender, [instance.pk], 'delete', using=using)
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def forget_cached_user(sender, instance, **kwargs):
+    auth.forget_user(instance.pk)
+
+
+@receiver(user_logged_out)
+def forget_logged_out_user(sender, user, **kwargs):
+    if user is not None:
+        auth.forget_user(user.pk)
+
+
+@receiver(post_save, sender=get_user_model())
+def invalidate_author_articles(sender, instance, created, update_fields=None, **kwargs):
+    # Articles carry a copy of the author's username; logins only touch
+    # last_login and must not flush anything.
+    if created or (update_fields is not None and 'username' not in update_fields):
+        return
+    for articles in shards.querysets(Article.objects.filter(author=instance)):
+        renamed = list(articles.exclude(author_username=instance.username).values_list('id', flat=True))
+        if renamed:
+            # A new version, so the detail ETag changes with the author name.
+            articles.filter(id__in=renamed).update(author_username=instance.username, version=F('version') + 1,
+                                                   updated_at=timezone.now())
+            changelog.record(Article, renamed, 'update', using=articles.db)
+        cache.invalidate('article', *articles.values_list('id', flat=True), using=articles.db)
+    FeedEntry.objects.filter(author_id=instance.pk).exclude(author_username=instance.username).update(author_username=instance.username)
+
+
+@receiver(rows_changed)
+def rows_changed_handler(sender, pks, **kwargs):
+    # Senders write on the current shard (default without sharding).
+    using = shards.current()
+    changelog.record(sender, pks, kwargs.get('action', 'update'), using=using)
+    if sender is Article:
+        cache.invalidate('article', *pks, using=using)
+        if kwargs.get('action') == 'delete':
+            # Soft delete: the comments stay in the table until
+            # blog_purge_deleted, but must stop being served from the cache.
+            tasks.enqueue('remove_articles', ids=list(pks))
+            feed.remove(pks)
+            cache.invalidate('comment', *Comment.all_objects.filter(article_id__in=pks).values_list('id', flat=True),
+                             using=using)
+        else:
+            tasks.enqueue('index_articles', ids=list(pks))
+            if kwargs.get('action') == 'create':
+                feed.add_ids(pks)
+            else:
+                feed.refresh(pks)
+    elif sender is Comment:
+        cache.invalidate('comment', *pks, using=using)
+        if kwargs.get('action') == 'create':
+            tasks.enqueue('notify_comments', ids=list(pks))
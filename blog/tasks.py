@@ -0,0 +1,115 @@
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import routers, search, shards
+from .models import Comment, Task
+
+logger = logging.getLogger('blog.tasks')
+
+LEASE_SECONDS = 300
+
+REGISTRY = {}
+
+
+def task(func):
+    REGISTRY[func.__name__] = func
+    return func
+
+
+def enqueue(name, **kwargs):
+    # The row is inserted once the surrounding transaction (on the current
+    # shard, if any) commits, so a rolled back write queues nothing and the
+    # worker never runs ahead of the data. A crash right after the commit loses the task;
+    # blog_rebuild_search repairs the index.
+    if name not in REGISTRY:
+        raise KeyError('unknown task %r' % name)
+    if settings.BLOG_TASKS_EAGER:
+        REGISTRY[name](**kwargs)
+    else:
+        transaction.on_commit(lambda: Task.objects.create(name=name, kwargs=kwargs), using=shards.current())
+
+
+def claim(batch_size, lease=LEASE_SECONDS):
+    # Other workers skip the claimed rows until the lease runs out, which
+    # also releases tasks whose worker died mid-run.
+    now = timezone.now()
+    with transaction.atomic():
+        due = (Task.objects.select_for_update(skip_locked=True)
+               .filter(failed_at__isnull=True, run_after__lte=now)
+               .filter(Q(locked_until__isnull=True) | Q(locked_until__lt=now)))
+        ids = list(due.order_by('run_after').values_list('id', flat=True)[:batch_size])
+        Task.objects.filter(id__in=ids).update(locked_until=now + timedelta(seconds=lease), attempts=F('attempts') + 1)
+        return list(Task.objects.filter(id__in=ids).order_by('run_after'))
+
+
+def run(queued):
+    try:
+        REGISTRY[queued.name](**queued.kwargs)
+    except Exception:
+        fail(queued, traceback.format_exc())
+        return False
+    Task.objects.filter(id=queued.id).delete()
+    return True
+
+
+def fail(queued, error):
+    now = timezone.now()
+    if queued.attempts >= settings.BLOG_TASKS_MAX_ATTEMPTS:
+        logger.error('task %s %s failed after %d attempts\n%s', queued.id, queued.name, queued.attempts, error)
+        Task.objects.filter(id=queued.id).update(failed_at=now, locked_until=None, last_error=error)
+    else:
+        delay = settings.BLOG_TASKS_RETRY_DELAY * 2 ** (queued.attempts - 1)
+        Task.objects.filter(id=queued.id).update(run_after=now + timedelta(seconds=delay), locked_until=None, last_error=error)
+
+
+def run_pending(batch_size=100):
+    # Returns (succeeded, failed). Tasks read from the primary: a replica
+    # may not have the rows they were queued for yet.
+    pinned = routers.is_pinned()
+    routers.set_pinned(True)
+    try:
+        results = [run(queued) for queued in claim(batch_size)]
+    finally:
+        routers.set_pinned(pinned)
+    return results.count(True), results.count(False)
+
+
+@task
+def index_articles(ids):
+    search.index_articles(ids)
+
+
+@task
+def remove_articles(ids):
+    search.remove_articles(ids)
+
+
+@task
+def notify_comments(ids):
+    # Mails the article's author about comments by other users. The mail
+    # machinery is only imported by the worker that needs it.
+    from django.core.mail import send_mail
+
+    if shards.enabled():
+        # Users stay on the default database and cannot be joined.
+        comments = shards.fetch(Comment.objects.select_related('article').only(
+            'content', 'author_id', 'article__title', 'article__author_id'), ids)
+        users = get_user_model().objects.only('username', 'email').in_bulk(
+            {c.author_id for c in comments} | {c.article.author_id for c in comments})
+        pairs = [(c, users.get(c.article.author_id), users.get(c.author_id)) for c in comments]
+    else:
+        comments = (Comment.objects.filter(id__in=ids).select_related('article__author', 'author')
+                    .only('content', 'author__username', 'article__title', 'article__author__email'))
+        pairs = [(c, c.article.author, c.author) for c in comments]
+    for comment, recipient, author in pairs:
+        if recipient is not None and author is not None and recipient.email and recipient.id != comment.author_id:
+            send_mail('New comment on "%s"' % comment.article.title,
+                      '%s wrote:\n\n%s' % (author.username, comment.content),
+                      None, [recipient.email])
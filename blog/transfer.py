@@ -0,0 +1,206 @@
+import contextlib
+import gzip
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import router, transaction
+from django.db.models import TextField
+from django.db.models.functions import Cast
+
+from . import codec, shards
+from .models import Article, Comment, ImportBatch
+
+FORMAT = 'blog-export'
+FORMAT_VERSION = 1
+
+# Columns written per record type, in the order the types are written: a
+# record only refers to ids that appeared above it. Records are JSON
+# arrays, [type, *columns], one per line after a header naming the columns.
+FIELDS = {
+    'user': ('id', 'username', 'password', 'email', 'first_name', 'last_name', 'is_active',
+             'is_staff', 'is_superuser', 'date_joined', 'last_login'),
+    'article': ('id', 'author_id', 'author_username', 'title', 'content', 'created_at', 'updated_at',
+                'version', 'comment_count'),
+    'comment': ('id', 'article_id', 'author_id', 'content', 'created_at', 'updated_at', 'version'),
+}
+DATETIME_FIELDS = frozenset(('date_joined', 'last_login', 'created_at', 'updated_at'))
+MODELS = {'user': get_user_model(), 'article': Article, 'comment': Comment}
+# Old id -> new id, kept for the types other records point at.
+REFERENCES = {'article': {'author_id': 'user'}, 'comment': {'article_id': 'article', 'author_id': 'user'}}
+
+
+class InvalidExport(ValueError):
+    pass
+
+
+def parse_timestamp(value):
+    # fromisoformat() is far cheaper than the parsing Django would do on
+    # save. Values without an offset are UTC.
+    if value is None:
+        return None
+    parsed = datetime.fromisoformat(value[:-1] + '+00:00' if value.endswith('Z') else value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def open_stream(path, mode):
+    # A .gz suffix means gzip, on both sides.
+    if path.endswith('.gz'):
+        return gzip.open(path, mode, compresslevel=6) if 'w' in mode else gzip.open(path, mode)
+    return open(path, mode)
+
+
+def export(out, chunk_size, progress=None):
+    # Live rows only (soft-deleted articles and their comments are left
+    # out), streamed with a chunked cursor so memory stays flat.
+    # Timestamps are read as the database's own text (UTC) rather than
+    # converted to datetimes and back.
+    out.write(codec.dumps({'format': FORMAT, 'version': FORMAT_VERSION, 'fields': FIELDS}) + b'\n')
+    counts = {}
+    for kind, model in MODELS.items():
+        counts[kind] = 0
+        columns = [Cast(name, TextField()) if name in DATETIME_FIELDS else name for name in FIELDS[kind]]
+        rows = shards.iterator(model.objects.values_list(*columns), chunk_size)
+        lines = []
+        for row in rows:
+            lines.append(codec.dumps((kind,) + row))
+            if len(lines) == chunk_size:
+                counts[kind] += write_lines(out, lines)
+                if progress is not None:
+                    progress(kind, counts[kind])
+        counts[kind] += write_lines(out, lines)
+    return counts
+
+
+def write_lines(out, lines):
+    if lines:
+        out.write(b'\n'.join(lines) + b'\n')
+    written = len(lines)
+    lines.clear()
+    return written
+
+
+@contextlib.contextmanager
+def preserved_timestamps():
+    # bulk_create() would stamp created_at/updated_at with the current time.
+    fields = [field for model in (Article, Comment) for field in model._meta.concrete_fields
+              if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+@contextlib.contextmanager
+def batch_transaction():
+    # One transaction on the default database (users, ImportBatch) and,
+    # with sharding, one per shard inside it. The shards commit just before
+    # the default database; a crash between the two re-imports the batch
+    # on the shards.
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(transaction.atomic())
+        for alias in settings.BLOG_SHARDS:
+            stack.enter_context(transaction.atomic(using=alias))
+        yield
+
+
+class Importer:
+    # Inserts records in batches of one type, one transaction per batch.
+    # With a checkpoint name, each batch also writes an ImportBatch row
+    # (input position, new id mappings) in that transaction, so a batch is
+    # recorded exactly when it is committed; a rerun with the same name
+    # resumes after the last recorded batch.
+    def __init__(self, batch_size, checkpoint=None, progress=None):
+        self.batch_size = batch_size
+        self.checkpoint = checkpoint
+        self.progress = progress
+        self.ids = {'user': {}, 'article': {}}
+        self.position = 0
+        self.counts = dict.fromkeys(MODELS, 0)
+        if checkpoint:
+            self.load_checkpoint()
+
+    def load_checkpoint(self):
+        batches = (ImportBatch.objects.using(router.db_for_write(ImportBatch))
+                   .filter(run=self.checkpoint).order_by('position').values_list('position', 'ids'))
+        for position, ids in batches.iterator():
+            self.position = position
+            for kind, mapping in ids.items():
+                self.ids[kind].update((int(old), new) for old, new in mapping.items())
+
+    def run(self, stream):
+        header = codec.loads(stream.readline() or b'{}')
+        if header.get('format') != FORMAT or header.get('version') != FORMAT_VERSION:
+            raise InvalidExport('not a %s file (version %d)' % (FORMAT, FORMAT_VERSION))
+        self.fields = {kind: tuple(fields) for kind, fields in header['fields'].items()}
+        self.timestamps = {kind: DATETIME_FIELDS.intersection(fields) for kind, fields in self.fields.items()}
+        kind, batch, position = None, [], 0
+        for position, line in enumerate(stream, 1):
+            if position <= self.position:
+                continue
+            record = codec.loads(line)
+            if batch and (record[0] != kind or len(batch) == self.batch_size):
+                self.flush(kind, batch, position - 1)
+                batch = []
+            kind = record[0]
+            row = dict(zip(self.fields[kind], record[1:]))
+            for field in self.timestamps[kind]:
+                row[field] = parse_timestamp(row[field])
+            batch.append(row)
+        if batch:
+            self.flush(kind, batch, position)
+        return self.counts
+
+    def flush(self, kind, rows, position):
+        with batch_transaction(), preserved_timestamps():
+            mapping = getattr(self, 'insert_%s' % kind)(rows)
+            if self.checkpoint:
+                self.record(position, {kind: {str(old): new for old, new in mapping.items()}} if mapping else {})
+        self.position = position
+        self.counts[kind] += len(rows)
+        if self.progress is not None:
+            self.progress(kind, self.counts[kind])
+
+    def record(self, position, ids):
+        ImportBatch.objects.create(run=self.checkpoint, position=position, ids=ids)
+
+    def remap(self, kind, row):
+        for field, target in REFERENCES[kind].items():
+            try:
+                row[field] = self.ids[target][row[field]]
+            except KeyError:
+                raise InvalidExport('%s %s refers to unknown %s %s' % (kind, row['id'], target, row[field]))
+        return row
+
+    def insert_user(self, rows):
+        # Users are matched by username, so existing accounts are reused.
+        User = MODELS['user']
+        usernames = [row['username'] for row in rows]
+        existing = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+        User.objects.bulk_create([User(**dict(row, id=None)) for row in rows if row['username'] not in existing])
+        existing = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+        mapping = {row['id']: existing[row['username']] for row in rows}
+        self.ids['user'].update(mapping)
+        return mapping
+
+    def insert_article(self, rows):
+        last_id = Article.all_objects.order_by('-id').values_list('id', flat=True).first() or 0
+        # With sharding, new ids are allocated up front and each shard
+        # commits its part of the batch on its own.
+        objs = shards.bulk_create(Article, [Article(**dict(self.remap('article', row), id=None)) for row in rows])
+        new_ids = [obj.pk for obj in objs]
+        if None in new_ids:
+            # SQLite does not return the new keys; the batch holds the write
+            # lock, so they are the ids after last_id, in insertion order.
+            new_ids = list(Article.all_objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True))
+        mapping = {row['id']: new_id for row, new_id in zip(rows, new_ids)}
+        self.ids['article'].update(mapping)
+        return mapping
+
+    def insert_comment(self, rows):
+        shards.bulk_create(Comment, [Comment(**dict(self.remap('comment', row), id=None)) for row in rows])
+        return None
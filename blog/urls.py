@@ -1,13 +1,27 @@
+from django.conf import settings
 from django.urls import path
 from blog import views
 
+if settings.BLOG_ASYNC_VIEWS:
+    from blog import async_views as api_views
+else:
+    api_views = views
+
 urlpatterns = [
     path('signup/', views.signup, name='signup'),
     path('token/', views.token, name='token'),
     path('signin/', views.signin, name='signin'),
     path('signout/', views.signout, name='signout'),
-    path('article/', views.article_general, name='article'),
-    path('article/<int:article_id>/', views.article_specified, name='article'),
-    path('article/<int:article_id>/comment/', views.comment_article, name='article'),
-    path('comment/<int:comment_id>/', views.comment_specified, name='comment'),
+    path('article/', api_views.article_general, name='article'),
+    path('article/search/', views.article_search, name='article_search'),
+    path('article/bulk/', views.article_bulk, name='article_bulk'),
+    path('article/<int:article_id>/', api_views.article_specified, name='article_detail'),
+    path('article/<int:article_id>/content/', views.article_content, name='article_content'),
+    path('article/<int:article_id>/comment/', api_views.comment_article, name='article_comment'),
+    path('comment/<int:comment_id>/', api_views.comment_specified, name='comment'),
+    path('comment/bulk/', views.comment_bulk, name='comment_bulk'),
+    path('cache/', views.cache_stats, name='cache_stats'),
+    path('metrics/', views.metrics, name='metrics'),
+    path('changes/', api_views.change_feed, name='changes'),
+    path('feed/', views.recent_feed, name='feed'),
 ]
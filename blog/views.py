@@ -1,23 +1,47 @@
-from django.http import HttpResponse, HttpResponseNotAllowed, HttpResponseBadRequest, JsonResponse
+import time
+
+from django.http import HttpResponse, HttpResponseNotAllowed, HttpResponseBadRequest, StreamingHttpResponse
 from django.contrib.auth.models import User
 from django.views.decorators.csrf import ensure_csrf_cookie
-import json
-from json import JSONDecodeError
+from django.db import IntegrityError, router, transaction
 from django.contrib.auth import authenticate, login, logout
 from .models import Article
 from .models import Comment
 from django.contrib.auth.decorators import login_required
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from .conditional import row_etag, collection_validators, not_modified, set_validators
+from . import auth, bulk, cache, changelog, codec, feed, fieldsets, routers, search, shards
+from .fieldsets import InvalidFields
+from .codec import JsonBytesResponse
+from .fields import is_gzip, stored, unpack
+from .middleware import accepted_encodings
+from .schemas import ArticlePayload, CommentPayload, Credentials, PayloadError, read_json
+from .metrics import registry
+from .signals import rows_changed
+from .pagination import DEFAULT_LIMIT, InvalidPage, decode_cursor, encode_cursor, is_paginated, page_params, keyset_page, set_next_link
+
+STREAM_CHUNK_SIZE = 2000
+STREAM_FLUSH_ROWS = 200
+
+DETAIL_FIELDSETS = {
+    'article': (fieldsets.ARTICLE_DETAIL, fieldsets.ARTICLE_DETAIL_DEFAULT),
+    'comment': (fieldsets.COMMENT, fieldsets.COMMENT_DEFAULT),
+}
 
 
 def signup(request):
     if request.method == 'POST':
         try:
-            req_data = json.loads(request.body.decode())
-            username = req_data['username']
-            password = req_data['password']
-            User.objects.create_user(username, None ,password)
+            credentials = Credentials.parse(request)
+            with transaction.atomic():
+                User.objects.create_user(credentials.username, None, credentials.password)
             return HttpResponse(status=201)
-        except :
+        except PayloadError as e:
+            return HttpResponse(status=e.status)
+        except IntegrityError:
             return HttpResponse(status=400)
 
     else:
@@ -33,14 +57,23 @@ def token(request):
 
 def signin(request):
     if request.method == 'POST':
-        body = request.body.decode()
-        username = json.loads(body)['username']
-        password = json.loads(body)['password']
+        try:
+            credentials = Credentials.parse(request)
+        except PayloadError as e:
+            return HttpResponse(status=e.status)
+        username, password = credentials.username, credentials.password
+        ip = auth.client_ip(request)
+        if auth.signin_throttled(username, ip):
+            response = HttpResponse(status=429)
+            response['Retry-After'] = str(settings.BLOG_SIGNIN_WINDOW)
+            return response
         user = authenticate(request, username=username, password=password)
         if user is not None:
             login(request, user)
+            auth.clear_signin_failures(username)
             return HttpResponse( status=204)
         else:
+            auth.record_signin_failure(username, ip)
             return HttpResponse( status=401)
     else:
         return HttpResponse(status=405)
@@ -58,92 +91,267 @@ def article_general(request):
     if not request.user.is_authenticated:
         return HttpResponse(status=401)
     if request.method == 'GET':
-        all_article_list = [article for article in Article.objects.all().values()]
-        all_article_list = list(map(lambda x : {"title":x["title"], "content":x["content"], "author":x["author_id"]},all_article_list))
-        return JsonResponse(all_article_list, safe=False)
+        try:
+            names = fieldsets.requested(request, fieldsets.ARTICLE_LIST, fieldsets.ARTICLE_LIST_DEFAULT)
+            articles = fieldsets.values(Article.objects.all(), request, fieldsets.ARTICLE_LIST, names)
+            if 'stream' in request.GET:
+                return stream_articles(request, articles, names)
+            paginated = is_paginated(request)
+            if paginated:
+                limit, after = page_params(request)
+        except (InvalidPage, InvalidFields):
+            return HttpResponseBadRequest()
+        etag, last_modified = collection_validators('article', Article.objects.all())
+        etag = fieldsets.etag_variant(etag, names, fieldsets.ARTICLE_LIST_DEFAULT, request)
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+        if not paginated:
+            response = JsonBytesResponse([article_list_item(x, names) for x in shards.ordered(articles)])
+        else:
+            rows, next_cursor = shards.keyset_page(articles, limit, after)
+            response = JsonBytesResponse([article_list_item(x, names) for x in rows])
+            set_next_link(request, response, next_cursor)
+        return set_validators(response, etag, last_modified)
     elif request.method == "POST":
         try :
-            body = request.body.decode()
-            title = json.loads(body)['title']
-            content = json.loads(body)['content']
-        except (KeyError, JSONDecodeError) as e:
-            return HttpResponseBadRequest()
-        
-        article = Article(title=title, content=content, author=request.user)
+            payload = ArticlePayload.parse(request)
+        except PayloadError as e:
+            return HttpResponse(status=e.status)
+        article = Article(title=payload.title, content=payload.content, author=request.user)
         article.save()
-        res_dict ={"title":title,"content":content,"id":article.id}
-        return JsonResponse(res_dict, status=201)
+        res_dict ={"title":payload.title,"content":payload.content,"id":article.id}
+        return JsonBytesResponse(res_dict, status=201)
     else :
         return HttpResponse(status=405)
 
 
+def article_list_item(article, names=fieldsets.ARTICLE_LIST_DEFAULT):
+    return fieldsets.item(article, fieldsets.ARTICLE_LIST, names)
+
+
+def stream_articles(request, articles, names):
+    mode = request.GET['stream']
+    if mode not in ('json', 'ndjson'):
+        raise InvalidPage('invalid stream mode')
+    cursor = request.GET.get('cursor')
+    if cursor:
+        articles = articles.filter(id__gt=decode_cursor(cursor))
+    rows = shards.iterator(articles, STREAM_CHUNK_SIZE)
+    if mode == 'ndjson':
+        return StreamingHttpResponse(ndjson_chunks(rows, names), content_type='application/x-ndjson')
+    return StreamingHttpResponse(json_array_chunks(rows, names), content_type='application/json')
+
+
+def ndjson_chunks(rows, names):
+    buffer = []
+    for row in rows:
+        buffer.append(codec.dumps(article_list_item(row, names)))
+        if len(buffer) >= STREAM_FLUSH_ROWS:
+            yield b'\n'.join(buffer) + b'\n'
+            buffer = []
+    if buffer:
+        yield b'\n'.join(buffer) + b'\n'
+
+
+def json_array_chunks(rows, names):
+    yield b'['
+    first = True
+    for chunk in ndjson_chunks(rows, names):
+        items = chunk.rstrip(b'\n').replace(b'\n', b',')
+        yield items if first else b',' + items
+        first = False
+    yield b']'
+
+
+def load_article_entry(article_id):
+    # Cache fills read the primary: an entry filled from a lagging replica
+    # would outlive a writer's pin and hand them their pre-write data.
+    article = Article.objects.using(router.db_for_write(Article)).only('title', 'content', 'version', 'updated_at', 'author_username', 'comment_count').filter(id=article_id).first()
+    if article is None:
+        return None
+    res_dict = {"title":article.title,"content":article.content,"author":article.author_username,"comment_count":article.comment_count}
+    return cache.set_payload('article', article_id, (
+        row_etag('article', article_id, article.version, article.comment_count), int(article.updated_at.timestamp()), codec.dumps(res_dict)))
+
+
+def load_comment_entry(comment_id):
+    comment = Comment.objects.using(router.db_for_write(Comment)).filter(id=comment_id).values('article_id', 'author_id', 'content', 'version', 'updated_at').first()
+    if comment is None:
+        return None
+    res_dict = {"article":comment["article_id"],"author":comment["author_id"],"content":comment["content"]}
+    return cache.set_payload('comment', comment_id, (
+        row_etag('comment', comment_id, comment["version"]), int(comment["updated_at"].timestamp()), codec.dumps(res_dict)))
+
+
+def projected_detail(request, kind, pk, names):
+    # ?fields= on a detail endpoint: project a cached payload when there is
+    # one, otherwise read just the requested columns (nothing is cached).
+    columns, default = DETAIL_FIELDSETS[kind]
+    entry = cached_entry(kind, pk)
+    if entry is not None:
+        etag, last_modified, data = entry[0], entry[1], fieldsets.select(codec.loads(entry[2]), request, names)
+    else:
+        model = Article if kind == 'article' else Comment
+        extra = ('version', 'updated_at') + (('comment_count',) if kind == 'article' else ())
+        row = fieldsets.values(model.objects.filter(id=pk), request, columns, names, extra).first()
+        if row is None:
+            return HttpResponse(status=404)
+        versions = (row['version'], row['comment_count']) if kind == 'article' else (row['version'],)
+        etag, last_modified = row_etag(kind, pk, *versions), int(row['updated_at'].timestamp())
+        data = fieldsets.item(row, columns, names)
+    return detail_response(request, fieldsets.etag_variant(etag, names, default, request), last_modified, codec.dumps(data))
+
+
+def cached_entry(kind, pk):
+    # A client pinned to the primary has just written; an entry filled just
+    # before that write could still predate it, so reload instead.
+    return None if routers.is_pinned() else cache.get_payload(kind, pk)
+
+
+def detail_response(request, etag, last_modified, payload):
+    response = not_modified(request, etag, last_modified)
+    if response is None:
+        response = set_validators(HttpResponse(payload, content_type='application/json'), etag, last_modified)
+    return response
+
+
+def ownership_error(queryset, user):
+    # Only reached when a conditional write touched no rows (or the body was
+    # unusable), to tell a missing row apart from someone else's row.
+    author_id = queryset.values_list('author_id', flat=True).first()
+    if author_id is None:
+        return HttpResponse(status=404)
+    if author_id != user.id:
+        return HttpResponse(status=403)
+    return None
+
+
 def article_specified(request, article_id=""):
     if not request.user.is_authenticated:
         return HttpResponse(status=401)
     if request.method == 'GET':
-        article = Article.objects.filter(id=article_id).values()
-        if not article :
+        try:
+            names = fieldsets.requested(request, fieldsets.ARTICLE_DETAIL, fieldsets.ARTICLE_DETAIL_DEFAULT)
+            if names != fieldsets.ARTICLE_DETAIL_DEFAULT and request.GET.get('include') != 'comments':
+                return projected_detail(request, 'article', article_id, names)
+        except InvalidFields:
+            return HttpResponseBadRequest()
+        entry = cached_entry('article', article_id) or load_article_entry(article_id)
+        if entry is None:
             return HttpResponse(status=404)
-        article = article[0]
-        username = User.objects.get(id=article["author_id"]).username
-        res_dict = {"title":article["title"],"content":article["content"],"author":username}
-        return JsonResponse(res_dict, safe=False)
+        if request.GET.get('include') == 'comments':
+            res_dict = fieldsets.select(codec.loads(entry[2]), request, names)
+            res_dict['comments'], res_dict['comments_next'] = comment_page(None, article_id)
+            return JsonBytesResponse(res_dict)
+        return detail_response(request, *entry)
     elif request.method == "PUT":
-        article = Article.objects.filter(id=article_id).values()
-        if not article :
-            return HttpResponse(status=404)
-        article = article[0]
-        author_id= article["author_id"]
-        if author_id != request.user.id :
-            return HttpResponse(status=403)
         try:
-            body = request.body.decode()
-            title = json.loads(body)['title']
-            content = json.loads(body)['content']
-        except (KeyError, JSONDecodeError) as e:
-            return HttpResponseBadRequest()
-        article = Article.objects.filter(id=article_id).first()
-        article.title=title
-        article.content=content
-        article.save()
-        response_dict = {'id': article.id, 'title': article.title, 'content':article.content, 'author':request.user.username}
-        return JsonResponse(response_dict, status=200, safe=False)
+            payload = ArticlePayload.parse(request)
+        except PayloadError as e:
+            return ownership_error(Article.objects.filter(id=article_id), request.user) or HttpResponse(status=e.status)
+        title, content = payload.title, payload.content
+        with transaction.atomic(using=router.db_for_write(Article)):
+            updated = Article.objects.filter(id=article_id, author=request.user).update(
+                title=title, content=content, version=F('version') + 1, updated_at=timezone.now())
+            if updated:
+                rows_changed.send(sender=Article, pks=[article_id], action='update')
+        if not updated:
+            return ownership_error(Article.objects.filter(id=article_id), request.user)
+        response_dict = {'id': article_id, 'title': title, 'content':content, 'author':request.user.username}
+        return JsonBytesResponse(response_dict, status=200)
     elif request.method == 'DELETE':
-        article = Article.objects.filter(id=article_id).values()
-        if not article :
-            return HttpResponse(status=404)
-        article = article[0]
-        author_id= article["author_id"]
-        if author_id != request.user.id :
-            return HttpResponse(status=403)
-        Article.objects.filter(id=article_id).delete()
+        with transaction.atomic(using=router.db_for_write(Article)):
+            deleted = Article.objects.filter(id=article_id, author=request.user).soft_delete()
+            if deleted:
+                rows_changed.send(sender=Article, pks=[article_id], action='delete')
+        if not deleted:
+            return ownership_error(Article.objects.filter(id=article_id), request.user)
         return HttpResponse(status=200)
     else :
         return HttpResponse(status=405)
 
 
+def article_content(request, article_id):
+    # The content alone, as text/plain. Content stored gzipped goes out as
+    # stored to clients that accept gzip: nothing is inflated or compressed.
+    if not request.user.is_authenticated:
+        return HttpResponse(status=401)
+    if request.method != 'GET':
+        return HttpResponse(status=405)
+    row = Article.objects.filter(id=article_id).values_list('version', 'updated_at', stored('content')).first()
+    if row is None:
+        return HttpResponse(status=404)
+    version, updated_at, content = row
+    accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    gzipped = is_gzip(content) and accepted.get('gzip', accepted.get('*', 0.0)) > 0
+    # The gzip bytes are a different representation of the same version.
+    etag = ('W/' if gzipped else '') + row_etag('article', article_id, version)
+    response = not_modified(request, etag, int(updated_at.timestamp()))
+    if response is None:
+        body = bytes(content)[1:] if gzipped else unpack(content).encode()
+        response = set_validators(HttpResponse(body, content_type='text/plain; charset=utf-8'),
+                                  etag, int(updated_at.timestamp()))
+        if gzipped:
+            response['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def comment_list_item(comment, names=fieldsets.COMMENT_DEFAULT):
+    return fieldsets.item(comment, fieldsets.COMMENT, names)
+
+
+def comment_page(request, article_id):
+    # Newest first; served by the (article_id, id) index on Comment.
+    # Without limit/cursor parameters every comment is returned.
+    names = fieldsets.COMMENT_DEFAULT if request is None else fieldsets.requested(request, fieldsets.COMMENT, fieldsets.COMMENT_DEFAULT)
+    comments = fieldsets.values(Comment.objects.filter(article_id=article_id), request, fieldsets.COMMENT, names)
+    if request is None:
+        rows, next_cursor = keyset_page(comments, DEFAULT_LIMIT, descending=True)
+    elif is_paginated(request):
+        limit, before = page_params(request)
+        rows, next_cursor = keyset_page(comments, limit, before, descending=True)
+    else:
+        rows, next_cursor = comments.order_by('-id'), None
+    return [comment_list_item(x, names) for x in rows], next_cursor
+
 
 def comment_article(request, article_id=""):
     if not request.user.is_authenticated:
         return HttpResponse(status=401)
     if request.method == 'POST':
-        if not Article.objects.filter(id=article_id):
-            return HttpResponse(status=404)
-        try :
-            body = request.body.decode()
-            content = json.loads(body)['content']
-        except (KeyError, JSONDecodeError) as e:
-            return HttpResponseBadRequest()
-        comment = Comment(content=content, author=request.user, article=Article.objects.filter(id=article_id).first())
-        comment.save()
-        res_dict = {"content":content,"id":comment.id}
-        return JsonResponse(res_dict,status=201)
+        with transaction.atomic(using=router.db_for_write(Comment)):
+            # Locked so a purge cannot remove the article under the new comment.
+            if not Article.objects.select_for_update().filter(id=article_id).exists():
+                return HttpResponse(status=404)
+            try :
+                payload = CommentPayload.parse(request)
+            except PayloadError as e:
+                return HttpResponse(status=e.status)
+            comment = Comment(content=payload.content, author=request.user, article_id=article_id)
+            comment.save()
+        res_dict = {"content":payload.content,"id":comment.id}
+        return JsonBytesResponse(res_dict,status=201)
     elif request.method == 'GET':
-        if not Article.objects.filter(id=article_id):
+        if not Article.objects.filter(id=article_id).exists():
             return HttpResponse(status=404)
-        comment = Comment.objects.filter(article=Article.objects.filter(id=article_id).first()).values()
-        res_dict = {"article":comment[0]["article_id"], "author":comment[0]["author_id"],"content":comment[0]["content"]}
-        return JsonResponse(res_dict, safe=False)
+        try:
+            names = fieldsets.requested(request, fieldsets.COMMENT, fieldsets.COMMENT_DEFAULT)
+        except InvalidFields:
+            return HttpResponseBadRequest()
+        etag, last_modified = collection_validators('comment', Comment.objects.filter(article_id=article_id))
+        etag = fieldsets.etag_variant(etag, names, fieldsets.COMMENT_DEFAULT, request)
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+        try:
+            comments, next_cursor = comment_page(request, article_id)
+        except InvalidPage:
+            return HttpResponseBadRequest()
+        response = JsonBytesResponse(comments)
+        set_next_link(request, response, next_cursor)
+        return set_validators(response, etag, last_modified)
     else:
         return HttpResponse(status=405)
 
@@ -151,39 +359,131 @@ def comment_specified(request, comment_id=""):
     if not request.user.is_authenticated:
         return HttpResponse(status=401)
     if request.method == 'GET':
-        comment = Comment.objects.filter(id=comment_id).values()
-        if not comment :
+        try:
+            names = fieldsets.requested(request, fieldsets.COMMENT, fieldsets.COMMENT_DEFAULT)
+        except InvalidFields:
+            return HttpResponseBadRequest()
+        if names != fieldsets.COMMENT_DEFAULT:
+            return projected_detail(request, 'comment', comment_id, names)
+        entry = cached_entry('comment', comment_id) or load_comment_entry(comment_id)
+        if entry is None:
             return HttpResponse(status=404)
-        res_dict = {"article":comment[0]["article_id"],"author":comment[0]["author_id"],"content":comment[0]["content"]}
-        return JsonResponse(res_dict, safe=False)
+        return detail_response(request, *entry)
     elif request.method == "PUT":
-        comment = Comment.objects.filter(id=comment_id).values()
-        if not comment :
-            return HttpResponse(status=404)
-        comment= comment[0]
-        author_id= comment["author_id"]
-        if author_id != request.user.id :
-            return HttpResponse(status=403)
         try:
-            body = request.body.decode()
-            content = json.loads(body)['content']
-        except (KeyError, JSONDecodeError) as e:
-            return HttpResponseBadRequest()
-        comment = Comment.objects.filter(id=comment_id).first()
-        comment.content=content
-        comment.save()
-        response_dict = {'id': comment.id, 'content':comment.content}
-        return JsonResponse(response_dict, status=200, safe=False)
+            content = CommentPayload.parse(request).content
+        except PayloadError as e:
+            return ownership_error(Comment.objects.filter(id=comment_id), request.user) or HttpResponse(status=e.status)
+        with transaction.atomic(using=router.db_for_write(Comment)):
+            updated = Comment.objects.filter(id=comment_id, author=request.user).update(
+                content=content, version=F('version') + 1, updated_at=timezone.now())
+            if updated:
+                rows_changed.send(sender=Comment, pks=[comment_id], action='update')
+        if not updated:
+            return ownership_error(Comment.objects.filter(id=comment_id), request.user)
+        response_dict = {'id': comment_id, 'content':content}
+        return JsonBytesResponse(response_dict, status=200)
     elif request.method == 'DELETE':
-        comment = Comment.objects.filter(id=comment_id).values()
-        if not comment :
-            return HttpResponse(status=404)
-        comment= comment[0]
-        author_id= comment["author_id"]
-        if author_id != request.user.id :
-            return HttpResponse(status=403)
-        comment = Comment.objects.filter(id=comment_id).delete()
+        deleted, _ = Comment.objects.filter(id=comment_id, author=request.user).delete()
+        if not deleted:
+            return ownership_error(Comment.objects.filter(id=comment_id), request.user)
         return HttpResponse(status=200)
     else :
         return HttpResponse(status=405)
 
+
+def cache_stats(request):
+    if not request.user.is_authenticated:
+        return HttpResponse(status=401)
+    if request.method == 'GET':
+        return JsonBytesResponse(cache.stats())
+    else:
+        return HttpResponse(status=405)
+
+
+def metrics(request):
+    if request.method == 'GET':
+        return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+    else:
+        return HttpResponse(status=405)
+
+
+def bulk_operations(request, model):
+    if not request.user.is_authenticated:
+        return HttpResponse(status=401)
+    if request.method == 'POST':
+        try:
+            items = read_json(request, settings.BLOG_MAX_BULK_BODY_BYTES)
+            bulk.validate(model, items)
+        except PayloadError as e:
+            return HttpResponse(status=e.status)
+        except bulk.BulkError as e:
+            return JsonBytesResponse({"errors": e.errors}, status=400)
+        return JsonBytesResponse({"results": bulk.execute(model, items, request.user)})
+    else:
+        return HttpResponse(status=405)
+
+
+def article_bulk(request):
+    return bulk_operations(request, Article)
+
+
+def comment_bulk(request):
+    return bulk_operations(request, Comment)
+
+
+def article_search(request):
+    if not request.user.is_authenticated:
+        return HttpResponse(status=401)
+    if request.method == 'GET':
+        query = request.GET.get('q', '').strip()
+        if not query:
+            return HttpResponseBadRequest()
+        try:
+            limit, offset = page_params(request)
+        except InvalidPage:
+            return HttpResponseBadRequest()
+        offset = offset or 0
+        results = search.get_backend().search(query, limit + 1, offset)
+        next_cursor = encode_cursor(offset + limit) if len(results) > limit else None
+        response = JsonBytesResponse(results[:limit])
+        return set_next_link(request, response, next_cursor)
+    else:
+        return HttpResponse(status=405)
+
+
+def change_feed(request):
+    if not request.user.is_authenticated:
+        return HttpResponse(status=401)
+    if request.method == 'GET':
+        try:
+            since, limit, wait = changelog.params(request)
+        except InvalidPage:
+            return HttpResponseBadRequest()
+        # Long-poll: hold the request until something is logged after
+        # since, or min(wait, BLOG_CHANGES_MAX_WAIT) seconds pass.
+        deadline = time.monotonic() + min(wait, settings.BLOG_CHANGES_MAX_WAIT)
+        try:
+            body = changelog.read(since, limit)
+            while body is None and time.monotonic() < deadline:
+                time.sleep(settings.BLOG_CHANGES_POLL_INTERVAL)
+                body = changelog.read(since, limit)
+        except changelog.ChangesGone as e:
+            return JsonBytesResponse({'horizon': e.horizon}, status=410)
+        return JsonBytesResponse(body or changelog.empty(since))
+    else:
+        return HttpResponse(status=405)
+
+
+def recent_feed(request):
+    if not request.user.is_authenticated:
+        return HttpResponse(status=401)
+    if request.method == 'GET':
+        try:
+            limit, after = page_params(request, decode=feed.decode_position)
+        except InvalidPage:
+            return HttpResponseBadRequest()
+        items, next_cursor = feed.page(limit, after)
+        return set_next_link(request, JsonBytesResponse(items), next_cursor)
+    else:
+        return HttpResponse(status=405)
@@ -9,8 +9,38 @@ https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myblog.settings')
+os.environ.setdefault('BLOG_ASYNC_VIEWS', '1')
 
-application = get_asgi_application()
+
+class StreamingASGIHandler(ASGIHandler):
+    # Django 3.1 iterates a streaming body on the event loop, where one read
+    # lazily from the database (?stream=json|ndjson) raises
+    # SynchronousOnlyOperation after the headers are out. Each part is
+    # produced on the thread that owns the connection instead, and sent just
+    # before the closing message.
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+        parts = iter(response)
+        response.streaming_content = ()
+        next_part = sync_to_async(next, thread_sensitive=True)
+
+        async def send_parts(message):
+            if message['type'] == 'http.response.body' and not message.get('more_body'):
+                part = await next_part(parts, None)
+                while part is not None:
+                    for chunk, _ in self.chunk_bytes(part):
+                        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                    part = await next_part(parts, None)
+            await send(message)
+
+        await super().send_response(response, send_parts)
+
+
+django.setup(set_prefix=False)
+application = StreamingASGIHandler()
@@ -10,8 +10,13 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
+from myblog.db import parse_database_url
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -41,6 +46,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'blog.middleware.MetricsMiddleware',
+    'blog.middleware.CompressionMiddleware',
+    'blog.middleware.ReplicaPinningMiddleware',
+    'blog.middleware.ShardMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -48,8 +57,23 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'blog.middleware.RateLimitMiddleware',
 ]
 
+# BLOG_API_ONLY=1 is the profile for processes that only serve /api/: no
+# admin, messages, staticfiles or template engine, and no middleware for
+# HTML pages. It starts faster and does less per request; compare the two
+# with `manage.py blog_bench_startup`. Also start API processes with
+# SETUPTOOLS_USE_DISTUTILS=stdlib in the environment: Django 3.1 imports
+# distutils, and setuptools' replacement for it pulls in pkg_resources.
+BLOG_API_ONLY = os.environ.get('BLOG_API_ONLY', '0') == '1'
+if BLOG_API_ONLY:
+    INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in (
+        'django.contrib.admin', 'django.contrib.messages', 'django.contrib.staticfiles')]
+    MIDDLEWARE = [name for name in MIDDLEWARE if name not in (
+        'django.contrib.messages.middleware.MessageMiddleware',
+        'django.middleware.clickjacking.XFrameOptionsMiddleware')]
+
 ROOT_URLCONF = 'myblog.urls'
 
 TEMPLATES = [
@@ -68,19 +92,140 @@ TEMPLATES = [
     },
 ]
 
+if BLOG_API_ONLY:
+    TEMPLATES = []
+
 WSGI_APPLICATION = 'myblog.wsgi.application'
 
+# Request metrics served at /api/metrics/. Set the sample rate below 1 to
+# measure only a fraction of requests; requests slower than
+# BLOG_SLOW_REQUEST_MS are logged to 'blog.slow' with their SQL.
+BLOG_METRICS_SAMPLE_RATE = float(os.environ.get('BLOG_METRICS_SAMPLE_RATE', 1.0))
+BLOG_SLOW_REQUEST_MS = float(os.environ.get('BLOG_SLOW_REQUEST_MS', 500))
+
+# Serve the article/comment API through blog.async_views. myblog/asgi.py
+# turns this on for ASGI deployments.
+BLOG_ASYNC_VIEWS = os.environ.get('BLOG_ASYNC_VIEWS', '0') == '1'
+
+# Largest JSON body accepted by the API (413 above it); bulk endpoints get
+# their own, larger cap. Django's own limit is raised to match so these
+# caps are the ones that apply.
+BLOG_MAX_BODY_BYTES = int(os.environ.get('BLOG_MAX_BODY_BYTES', 64 * 1024))
+BLOG_MAX_BULK_BODY_BYTES = int(os.environ.get('BLOG_MAX_BULK_BODY_BYTES', 8 * 1024 * 1024))
+DATA_UPLOAD_MAX_MEMORY_SIZE = BLOG_MAX_BULK_BODY_BYTES
+
+# /api/changes/ long-polls for up to BLOG_CHANGES_MAX_WAIT seconds, checking
+# the log every BLOG_CHANGES_POLL_INTERVAL; blog_compact_changes keeps
+# BLOG_CHANGES_RETENTION_DAYS of entries.
+BLOG_CHANGES_MAX_WAIT = float(os.environ.get('BLOG_CHANGES_MAX_WAIT', 25))
+BLOG_CHANGES_POLL_INTERVAL = float(os.environ.get('BLOG_CHANGES_POLL_INTERVAL', 0.5))
+BLOG_CHANGES_RETENTION_DAYS = int(os.environ.get('BLOG_CHANGES_RETENTION_DAYS', 7))
+
+# /api/feed/ serves the newest BLOG_FEED_SIZE articles from a table kept up
+# to date on every write; `manage.py blog_rebuild_feed` recreates it.
+BLOG_FEED_SIZE = int(os.environ.get('BLOG_FEED_SIZE', 500))
+
+# JSON responses at least this large are gzip (or brotli, if installed)
+# compressed when the client accepts it; streamed lists always are.
+BLOG_COMPRESS_MIN_BYTES = int(os.environ.get('BLOG_COMPRESS_MIN_BYTES', 1024))
+
+# Article and comment content of at least this many bytes (UTF-8) is
+# stored gzipped; changing it only affects rows written afterwards.
+BLOG_CONTENT_COMPRESS_MIN_BYTES = int(os.environ.get('BLOG_CONTENT_COMPRESS_MIN_BYTES', 1024))
+
+# Post-write side effects (search indexing, notifications) are queued in
+# blog_task and run by `manage.py blog_worker`; BLOG_TASKS_EAGER runs them
+# inline instead. Failed tasks are retried BLOG_TASKS_MAX_ATTEMPTS times,
+# BLOG_TASKS_RETRY_DELAY seconds apart, doubling each time.
+BLOG_TASKS_EAGER = os.environ.get('BLOG_TASKS_EAGER', '0') == '1'
+BLOG_TASKS_MAX_ATTEMPTS = int(os.environ.get('BLOG_TASKS_MAX_ATTEMPTS', 5))
+BLOG_TASKS_RETRY_DELAY = float(os.environ.get('BLOG_TASKS_RETRY_DELAY', 2))
+
 
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
 
+# DATABASE_URL picks the backend (see myblog.db.parse_database_url).
+# Connections are kept for BLOG_DB_CONN_MAX_AGE seconds and, with
+# BLOG_DB_HEALTH_CHECKS, checked at the start of each request. Set
+# BLOG_DB_POOLER=pgbouncer when PostgreSQL is reached through PgBouncer in
+# transaction mode. SQLite goes through myblog.sqlite3, which applies WAL
+# and related PRAGMAs on connect and starts transactions with BEGIN
+# IMMEDIATE, unless BLOG_SQLITE_TUNING=0.
+
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': parse_database_url(
+        os.environ.get('DATABASE_URL', 'sqlite:///%s' % (BASE_DIR / 'db.sqlite3')),
+        conn_max_age=int(os.environ.get('BLOG_DB_CONN_MAX_AGE', 60)),
+        pooler=os.environ.get('BLOG_DB_POOLER', '')),
+}
+BLOG_DB_HEALTH_CHECKS = os.environ.get('BLOG_DB_HEALTH_CHECKS', '1') == '1'
+
+# Read replicas, as a comma-separated BLOG_REPLICA_URLS. blog reads go to a
+# healthy replica (probed every BLOG_REPLICA_CHECK_INTERVAL seconds) except
+# for BLOG_REPLICA_PIN_SECONDS after the same client wrote. For a local
+# setup, copy db.sqlite3 to replica.sqlite3 (or run blog_sync_replica) and
+# set BLOG_REPLICA_URLS=sqlite:///replica.sqlite3.
+BLOG_DB_REPLICAS = []
+for _url in filter(None, os.environ.get('BLOG_REPLICA_URLS', '').split(',')):
+    BLOG_DB_REPLICAS.append('replica%d' % len(BLOG_DB_REPLICAS))
+    DATABASES[BLOG_DB_REPLICAS[-1]] = dict(
+        parse_database_url(_url, conn_max_age=DATABASES['default']['CONN_MAX_AGE']), TEST={'MIRROR': 'default'})
+BLOG_REPLICA_PIN_SECONDS = int(os.environ.get('BLOG_REPLICA_PIN_SECONDS', 5))
+BLOG_REPLICA_CHECK_INTERVAL = float(os.environ.get('BLOG_REPLICA_CHECK_INTERVAL', 5))
+BLOG_SQLITE_TUNING = os.environ.get('BLOG_SQLITE_TUNING', '1') == '1'
+
+# Shards for articles and comments, as a comma-separated BLOG_SHARD_URLS
+# (blog.shards maps ids to shards; users, sessions, the change log, search
+# index and task queue stay on default). Migrate each shard with
+# `migrate --database=shard0` etc. Local setup: BLOG_SHARD_URLS=
+# sqlite:///shard0.sqlite3,sqlite:///shard1.sqlite3. After changing the
+# list, pause writes and run blog_rebalance_shards.
+BLOG_SHARDS = []
+for _url in filter(None, os.environ.get('BLOG_SHARD_URLS', '').split(',')):
+    BLOG_SHARDS.append('shard%d' % len(BLOG_SHARDS))
+    DATABASES[BLOG_SHARDS[-1]] = parse_database_url(_url, conn_max_age=DATABASES['default']['CONN_MAX_AGE'])
+DATABASE_ROUTERS = ['blog.routers.ShardRouter', 'blog.routers.ReplicaRouter']
+
+
+# Sessions and authentication
+# BLOG_SESSION_ENGINE is 'db' (default), 'cached_db' or 'signed_cookies'.
+# With either of the last two, and users resolved through the blog cache by
+# CachedModelBackend, an authenticated request needs no queries to identify
+# the user. 'cached_db' and the user cache both need a blog cache shared by
+# every worker (BLOG_CACHE_SHARED): otherwise a logout, deactivation or
+# password change would only take effect in the process that made it.
+
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
 }
 
+SESSION_ENGINE = SESSION_ENGINES[os.environ.get('BLOG_SESSION_ENGINE', 'db')]
+
+AUTHENTICATION_BACKENDS = ['blog.auth.CachedModelBackend']
+
+BLOG_USER_CACHE_TIMEOUT = 300
+
+# Failed signins allowed per username and per client IP within the window
+# (seconds) before /api/signin/ answers 429 without checking the password.
+# Counted in the database (blog.SigninFailure), whatever the cache.
+BLOG_SIGNIN_MAX_FAILURES = int(os.environ.get('BLOG_SIGNIN_MAX_FAILURES', 5))
+BLOG_SIGNIN_MAX_IP_FAILURES = int(os.environ.get('BLOG_SIGNIN_MAX_IP_FAILURES', 50))
+BLOG_SIGNIN_WINDOW = int(os.environ.get('BLOG_SIGNIN_WINDOW', 300))
+
+# PBKDF2 cost; measure candidates with `manage.py blog_bench_hasher`.
+BLOG_PASSWORD_ITERATIONS = int(os.environ.get('BLOG_PASSWORD_ITERATIONS', 216000))
+
+PASSWORD_HASHERS = [
+    'blog.hashers.ConfigurablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -119,3 +264,65 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.1/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Caches
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+# The blog app caches serialized detail payloads under BLOG_CACHE_ALIAS.
+# BLOG_CACHE_BACKEND picks the store: 'locmem' (per-process LRU, the
+# default), 'file', or 'redis' (needs the django-redis package). Only the
+# last two are shared between worker processes (BLOG_CACHE_SHARED).
+
+BLOG_CACHE_BACKEND = os.environ.get('BLOG_CACHE_BACKEND', 'locmem')
+
+BLOG_CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'blog.cache.CountingLocMemCache',
+        'LOCATION': 'blog',
+    },
+    'file': {
+        'BACKEND': 'blog.cache.CountingFileBasedCache',
+        'LOCATION': os.environ.get('BLOG_CACHE_LOCATION', str(BASE_DIR / '.cache')),
+    },
+    'redis': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': os.environ.get('BLOG_CACHE_LOCATION', 'redis://127.0.0.1:6379/1'),
+    },
+}
+
+BLOG_CACHE_ALIAS = 'blog'
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    BLOG_CACHE_ALIAS: dict(
+        BLOG_CACHE_BACKENDS[BLOG_CACHE_BACKEND],
+        TIMEOUT=int(os.environ.get('BLOG_CACHE_TIMEOUT', 300)),
+        OPTIONS={'MAX_ENTRIES': int(os.environ.get('BLOG_CACHE_MAX_ENTRIES', 10000))},
+    ),
+}
+
+BLOG_CACHE_SHARED = BLOG_CACHE_BACKEND != 'locmem'
+
+SESSION_CACHE_ALIAS = BLOG_CACHE_ALIAS
+if SESSION_ENGINE == SESSION_ENGINES['cached_db'] and not BLOG_CACHE_SHARED:
+    raise ImproperlyConfigured("BLOG_SESSION_ENGINE=cached_db needs BLOG_CACHE_BACKEND 'file' or 'redis'")
+
+# Rate limits per client, keyed by URL name and method ('*' matches any),
+# as (requests per second, burst): up to ``burst`` requests in each window
+# of burst / rate seconds; see blog.middleware.RateLimitMiddleware. The
+# counters live in the blog cache, so limiting is on by default only when
+# that cache is shared by every worker; BLOG_RATE_LIMITING=1 with a
+# per-process cache is refused, since each worker would allow the full rate.
+BLOG_RATE_LIMITING = os.environ.get('BLOG_RATE_LIMITING', '1' if BLOG_CACHE_SHARED else '0') == '1'
+if BLOG_RATE_LIMITING and not BLOG_CACHE_SHARED:
+    raise ImproperlyConfigured("BLOG_RATE_LIMITING=1 needs BLOG_CACHE_BACKEND 'file' or 'redis'")
+BLOG_RATE_LIMITS = {
+    '*': {'*': (20, 100)},
+    'article': {'GET': (5, 30), 'POST': (2, 20)},
+    'article_search': {'GET': (5, 30)},
+    'article_bulk': {'POST': (1, 5)},
+    'comment_bulk': {'POST': (1, 5)},
+    'changes': {'GET': (2, 10)},
+} if BLOG_RATE_LIMITING else {}
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.db.backends.sqlite3 import base
+
+# Applied to every new connection. WAL lets readers run alongside the
+# single writer, NORMAL only fsyncs at checkpoints, busy_timeout makes
+# writers queue for the lock instead of failing with "database is locked".
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        if settings.BLOG_SQLITE_TUNING:
+            for name, value in PRAGMAS.items():
+                conn.execute('PRAGMA %s = %s' % (name, value))
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        # A deferred transaction that reads before it writes cannot wait for
+        # the write lock (SQLite reports SQLITE_BUSY at once to avoid a
+        # deadlock), so take it up front where busy_timeout applies.
+        self.cursor().execute('BEGIN IMMEDIATE' if settings.BLOG_SQLITE_TUNING else 'BEGIN')